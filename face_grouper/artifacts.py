@@ -0,0 +1,180 @@
+# artifacts.py - Stage outputs cached across runs, fingerprinted by their inputs and parameters
+import os
+import json
+import pickle
+import hashlib
+from collections.abc import Mapping
+import numpy as np
+from .logger import get_logger
+from .sources import BufferSource, ScannedPath, VideoFrameSource, source_key
+
+logger = get_logger(__name__)
+
+ARTIFACT_SUFFIX = '.pkl'
+
+
+def fingerprint(*parts):
+    """
+    SHA-1 over JSON-serialisable parts; numpy arrays are hashed by dtype,
+    shape and contents.
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            digest.update(f"{part.dtype.str}{part.shape}".encode('utf-8'))
+            digest.update(part.tobytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def file_fingerprint(key):
+    """
+    (size, mtime_ns) of the file behind a source key; None for in-memory
+    sources or missing files. Keys of scanned paths (see discovery.py)
+    already carry them.
+    """
+    if key.startswith(('buffer:', 'video:')):
+        return None
+    if isinstance(key, ScannedPath):
+        return key.size, key.mtime_ns
+    try:
+        stat = os.stat(key)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def detection_records(photo_data, no_faces):
+    """
+    Regroup the output of process_images per input file.
+
+    Returns:
+        Dict of source key -> list of (source, face) detections; frames of a
+        video are filed under the video
+    """
+    records = {}
+    for source, face in photo_data:
+        media = source.video_path if isinstance(source, VideoFrameSource) else source
+        records.setdefault(source_key(media), []).append((source, face))
+    for source in no_faces:
+        records.setdefault(source_key(source), [])
+    return records
+
+
+def canonical_order(photo_data):
+    """
+    Indices of photo_data sorted by source key and face position, so stage
+    fingerprints don't depend on the order the sources were processed in
+    (e.g. the shuffled sample of a progressive run).
+    """
+    return sorted(range(len(photo_data)),
+                  key=lambda i: (source_key(photo_data[i][0]), [round(float(v), 1) for v in photo_data[i][1].bbox[:4]]))
+
+
+def canonical_labels(labels, order):
+    """
+    labels in canonical order, renumbered by first appearance so that the
+    same grouping compares equal whatever ids clustering gave it (noise
+    stays -1).
+    """
+    ids = {}
+    return [-1 if labels[i] == -1 else ids.setdefault(labels[i], len(ids)) for i in order]
+
+
+class CachedDetections(Mapping):
+    """
+    Detections of a previous run, offered to process_images in place of its
+    resume records: a source counts as processed only while its file still
+    has the size and mtime it had when it was detected. extra (e.g. records
+    from a checkpoint) is consulted first.
+    """
+
+    def __init__(self, records, extra=None):
+        self.records = records
+        self.extra = extra or {}
+        self._valid = {}
+        self._len = len(set(self.extra) | set(self.records))
+
+    def __contains__(self, key):
+        if key in self.extra:
+            return True
+        if key not in self._valid:
+            entry = self.records.get(key)
+            self._valid[key] = entry is not None and entry[0] is not None and entry[0] == file_fingerprint(key)
+        return self._valid[key]
+
+    def __getitem__(self, key):
+        if key in self.extra:
+            return self.extra[key]
+        if key not in self:
+            raise KeyError(key)
+        return self.records[key][1]
+
+    def __iter__(self):
+        return iter(set(self.extra) | set(self.records))
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return bool(self.extra) or bool(self.records)
+
+
+class StageCache:
+    """
+    One artifact per pipeline stage in cache_dir, each stored with the
+    fingerprint of the inputs and parameters that produced it. load()
+    returns the artifact only if the fingerprint still matches, so a rerun
+    recomputes just the stages whose inputs changed (and everything after).
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, stage):
+        return os.path.join(self.cache_dir, stage + ARTIFACT_SUFFIX)
+
+    def load(self, stage, key):
+        """The artifact stage saved under fingerprint key, or None."""
+        try:
+            with open(self._path(stage), 'rb') as f:
+                artifact = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable {stage} artifact: {e}")
+            return None
+        if artifact.get('fingerprint') != key:
+            return None
+        return artifact['payload']
+
+    def save(self, stage, key, payload):
+        """Atomically replace the artifact of stage (temp file + rename)."""
+        path = self._path(stage)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'fingerprint': key, 'payload': payload}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load_detections(self, key):
+        """Per-file detection records saved for detector fingerprint key (empty if none)."""
+        return self.load('detect', key) or {}
+
+    def save_detections(self, key, photo_data, no_faces):
+        """
+        Save the detections of a run per input file with the file's size and
+        mtime. Uploads (in-memory buffers) are left out; their bytes are not
+        worth duplicating into the cache.
+        """
+        records = {}
+        for media_key, detections in detection_records(photo_data, no_faces).items():
+            if media_key.startswith('buffer:') or any(isinstance(s, BufferSource) and not isinstance(s, VideoFrameSource)
+                                                      for s, _ in detections):
+                continue
+            records[str(media_key)] = (file_fingerprint(media_key), detections)
+        self.save('detect', key, records)
+        return records
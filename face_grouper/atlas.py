@@ -0,0 +1,85 @@
+# atlas.py - Packs group thumbnails into a few sprite sheets for the overview
+import os
+import json
+import math
+import cv2
+import numpy as np
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+ATLAS_DIR = '.atlas'
+ATLAS_INDEX = 'atlas.json'
+
+
+def atlas_index_path(output_dir):
+    return os.path.join(output_dir, ATLAS_DIR, ATLAS_INDEX)
+
+
+def load_atlas_index(output_dir):
+    """The atlas index of output_dir, or None if it has none."""
+    try:
+        with open(atlas_index_path(output_dir), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_thumbnail_atlas(output_dir, folders, thumbnail_size=(150, 150), tiles_per_sheet=400, quality=90):
+    """
+    Pack the thumbnail.jpg of every group folder into sprite sheets.
+
+    Writes .atlas/atlas_<n>.jpg sheets plus .atlas/atlas.json mapping each
+    folder to its sheet and pixel offset, so a viewer can show all people
+    from a handful of images instead of one request per thumbnail.
+
+    Args:
+        output_dir: Output directory containing the group folders
+        folders: Group folder names to include, in display order
+        thumbnail_size: Tile size as (width, height) - default (150, 150)
+        tiles_per_sheet: Maximum number of thumbnails per sheet
+        quality: JPEG quality of the sheets
+
+    Returns:
+        The atlas index dict that was written
+    """
+    width, height = thumbnail_size
+    atlas_dir = os.path.join(output_dir, ATLAS_DIR)
+    os.makedirs(atlas_dir, exist_ok=True)
+
+    columns = max(1, int(math.ceil(math.sqrt(tiles_per_sheet))))
+    index = {'tile_size': [width, height], 'sheets': [], 'tiles': {}}
+
+    for sheet_number, start in enumerate(range(0, len(folders), tiles_per_sheet)):
+        sheet_folders = folders[start:start + tiles_per_sheet]
+        rows = int(math.ceil(len(sheet_folders) / columns))
+        sheet_columns = min(columns, len(sheet_folders))
+        sheet = np.full((rows * height, sheet_columns * width, 3), 255, dtype=np.uint8)
+
+        for position, folder in enumerate(sheet_folders):
+            thumb = cv2.imread(os.path.join(output_dir, folder, 'thumbnail.jpg'))
+            if thumb is None:
+                logger.warning(f"No thumbnail to pack for {folder}")
+                continue
+            if thumb.shape[:2] != (height, width):
+                thumb = cv2.resize(thumb, (width, height), interpolation=cv2.INTER_AREA)
+            x, y = (position % columns) * width, (position // columns) * height
+            sheet[y:y + height, x:x + width] = thumb
+            index['tiles'][folder] = {'sheet': sheet_number, 'x': x, 'y': y}
+
+        sheet_name = f'atlas_{sheet_number}.jpg'
+        cv2.imwrite(os.path.join(atlas_dir, sheet_name), sheet, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        index['sheets'].append(sheet_name)
+
+    # Drop sheets left over from a previous, larger atlas
+    for name in os.listdir(atlas_dir):
+        if name.startswith('atlas_') and name.endswith('.jpg') and name not in index['sheets']:
+            os.remove(os.path.join(atlas_dir, name))
+
+    tmp_path = atlas_index_path(output_dir) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, atlas_index_path(output_dir))
+
+    logger.info(f"Packed {len(index['tiles'])} thumbnails into {len(index['sheets'])} atlas sheet(s)")
+    return index
@@ -0,0 +1,147 @@
+# autotune.py - Per-machine calibration of decode workers and ONNX Runtime threads
+import os
+import json
+import time
+import platform
+from .config import AUTOTUNE_CACHE, AUTOTUNE_SAMPLE_SIZE, FACE_MODEL, IMAGE_EXTENSIONS
+from .detector import create_face_app
+from .discovery import scan_images
+from .logger import get_logger
+from .shared_frames import SharedFrameDecoder
+
+logger = get_logger(__name__)
+
+
+def machine_key():
+    """Identifies the host for the settings cache: CPU model, architecture and core count."""
+    cpu_model = platform.processor()
+    try:
+        with open('/proc/cpuinfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    cpu_model = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return f"{cpu_model or 'unknown'} / {platform.machine()} / {os.cpu_count()} cpus"
+
+
+def candidate_settings(cpus=None):
+    """
+    The configurations to calibrate: a few decode worker counts, each paired
+    with the ONNX Runtime thread counts that don't oversubscribe the cores.
+    """
+    cpus = cpus or os.cpu_count() or 1
+    candidates = []
+    for decode_workers in sorted({0, max(1, cpus // 4), max(1, cpus // 2)}):
+        remaining = max(1, cpus - decode_workers)
+        for threads in sorted({remaining, max(1, remaining // 2)}, reverse=True):
+            setting = {'decode_workers': decode_workers, 'intra_op_threads': threads}
+            if setting not in candidates:
+                candidates.append(setting)
+    return candidates
+
+
+def load_tuning_cache(cache_path=AUTOTUNE_CACHE):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_tuning_cache(cache, cache_path=AUTOTUNE_CACHE):
+    """Atomically write the settings cache (temp file + rename)."""
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, cache_path)
+
+
+def measure_setting(sample, setting, model_name=FACE_MODEL):
+    """Images per second detecting faces in sample with one configuration."""
+    # Imported here because main imports this module for run_pipeline(auto_tune=True)
+    from .main import process_images
+
+    face_app = create_face_app(model_name, setting['intra_op_threads'])
+    decode_workers = setting['decode_workers']
+    decoder = SharedFrameDecoder(decode_workers) if decode_workers > 0 else None
+    try:
+        # The first image pays for lazy initialisation and worker start-up; keep it out of the timing
+        process_images(None, sources=sample[:1], face_app=face_app, decoder=decoder)
+        start = time.perf_counter()
+        process_images(None, sources=sample, face_app=face_app, decoder=decoder)
+        seconds = time.perf_counter() - start
+    finally:
+        if decoder is not None:
+            decoder.close()
+    return len(sample) / seconds if seconds > 0 else 0.0
+
+
+def calibrate(sample, model_name=FACE_MODEL, candidates=None):
+    """
+    Measure every candidate configuration on sample and pick the fastest.
+
+    Returns:
+        Dict with the chosen 'settings', its 'images_per_second' and all 'results'
+    """
+    results = []
+    for setting in candidates or candidate_settings():
+        images_per_second = measure_setting(sample, setting, model_name)
+        logger.info(f"Calibration {setting}: {images_per_second:.1f} images/s")
+        results.append({'settings': setting, 'images_per_second': images_per_second})
+    best = max(results, key=lambda r: r['images_per_second'])
+    return {'settings': best['settings'], 'images_per_second': best['images_per_second'], 'results': results}
+
+
+def autotune(sample, model_name=FACE_MODEL, cache_path=AUTOTUNE_CACHE, refresh=False):
+    """
+    Settings for this machine: from the cache, or calibrated on sample and cached.
+
+    Args:
+        sample: Image paths to calibrate on (only used when calibrating);
+            may be empty if cached settings are acceptable
+        model_name: InsightFace model the settings are for
+        cache_path: JSON file keeping the chosen settings per machine and model
+        refresh: Calibrate even if cached settings exist
+
+    Returns:
+        Dict with 'settings', 'machine', 'cached' and, if known,
+        'images_per_second'; None if nothing is cached and sample is empty
+    """
+    key = f"{machine_key()} / {model_name}"
+    cache = load_tuning_cache(cache_path)
+    if key in cache and not refresh:
+        return dict(cache[key], machine=key, cached=True)
+    if not sample:
+        return None
+
+    logger.info(f"Calibrating on {len(sample)} images for {key}")
+    start = time.perf_counter()
+    result = calibrate(sample, model_name)
+    result['calibrated_at'] = time.time()
+    result['calibration_seconds'] = time.perf_counter() - start
+    cache[key] = result
+    save_tuning_cache(cache, cache_path)
+    logger.info(f"Chose {result['settings']} ({result['images_per_second']:.1f} images/s)")
+    return dict(result, machine=key, cached=False)
+
+
+def calibration_sample(source_folder=None, sources=None, size=AUTOTUNE_SAMPLE_SIZE):
+    """
+    Up to size image files to calibrate on: from sources if it is a list of
+    paths, otherwise from the first images found in source_folder. Streams
+    aren't sampled, since that would consume them.
+    """
+    if isinstance(sources, (list, tuple)):
+        return [s for s in sources if isinstance(s, str)
+                and os.path.splitext(s)[1].lower() in IMAGE_EXTENSIONS][:size]
+    if sources is None and source_folder:
+        sample = []
+        for entry in scan_images(source_folder, extensions=IMAGE_EXTENSIONS):
+            sample.append(entry.path)
+            if len(sample) == size:
+                break
+        return sample
+    return []
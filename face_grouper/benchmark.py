@@ -0,0 +1,201 @@
+# benchmark.py - End-to-end pipeline benchmark on a synthetic corpus
+#
+#   python -m face_grouper.benchmark --images 1000 --size 1280x960 --identities 20 --report bench.json
+#
+# The stub model (default) derives one face per image from a colour marker painted
+# into the synthetic images, so decode, cluster and organize costs can be measured
+# offline and reproducibly; --model real runs InsightFace instead (pair it with
+# --source and a folder of real photos, the synthetic images contain no faces).
+import os
+import json
+import time
+import shutil
+import zlib
+import argparse
+import cv2
+import numpy as np
+from .logger import get_logger
+from .main import run_pipeline
+from .metrics import RunMetrics
+
+logger = get_logger(__name__)
+
+CORPUS_SPEC = 'corpus.json'
+MARKER_LEVELS = 16
+MARKER_STEP = 14
+EMBEDDING_SIZE = 512
+
+
+class StubFace(dict):
+    """Minimal stand-in for insightface's Face: a dict with attribute access."""
+
+    def __getattr__(self, name):
+        return self.get(name)
+
+    @property
+    def normed_embedding(self):
+        return self['embedding'] / np.linalg.norm(self['embedding'])
+
+
+class StubFaceApp:
+    """
+    Deterministic replacement for the InsightFace model.
+
+    Reads the identity from the marker that generate_corpus() paints in the
+    centre of each image and returns one face whose embedding is the
+    identity's base vector plus a little image-dependent noise. Images
+    without a marker have no face. latency adds a fixed delay per call to
+    mimic model inference time.
+    """
+
+    def __init__(self, latency=0.0, noise=0.3):
+        self.latency = latency
+        self.noise = noise
+        self._base = {}
+
+    def _identity_embedding(self, identity):
+        if identity not in self._base:
+            self._base[identity] = np.random.default_rng(identity).normal(size=EMBEDDING_SIZE).astype(np.float32)
+        return self._base[identity]
+
+    def get(self, image):
+        if self.latency:
+            time.sleep(self.latency)
+        h, w = image.shape[:2]
+        marker = image[h // 2 - 4:h // 2 + 4, w // 2 - 4:w // 2 + 4].reshape(-1, 3).mean(axis=0)
+        blue, green, red = (int(round(v / MARKER_STEP)) for v in marker)
+        if red != MARKER_LEVELS - 1:
+            return []
+        identity = blue * MARKER_LEVELS + green
+
+        seed = zlib.crc32(np.ascontiguousarray(image[::37, ::37]).tobytes())
+        noise = np.random.default_rng(seed).normal(scale=self.noise, size=EMBEDDING_SIZE).astype(np.float32)
+        size = min(w, h) // 3
+        x1, y1 = (w - size) // 2, (h - size) // 2
+        return [StubFace(
+            bbox=np.array([x1, y1, x1 + size, y1 + size], dtype=np.float32),
+            det_score=0.99,
+            kps=None,
+            embedding=self._identity_embedding(identity) + noise,
+        )]
+
+
+def generate_corpus(corpus_dir, images=500, size=(1280, 960), identities=20, no_face_ratio=0.1, seed=0):
+    """
+    Write a synthetic JPEG corpus for benchmarking, reusing it if the spec matches.
+
+    Each image is textured noise with a flat marker square in the centre that
+    encodes its identity for StubFaceApp; no_face_ratio of the images get a
+    black marker, meaning no face.
+
+    Returns:
+        The corpus spec dict
+    """
+    spec = {'images': images, 'size': list(size), 'identities': identities,
+            'no_face_ratio': no_face_ratio, 'seed': seed}
+    spec_path = os.path.join(corpus_dir, CORPUS_SPEC)
+    if os.path.exists(spec_path):
+        with open(spec_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == spec:
+                logger.info(f"Reusing benchmark corpus in {corpus_dir}")
+                return spec
+        shutil.rmtree(corpus_dir)
+
+    if identities > MARKER_LEVELS * MARKER_LEVELS:
+        raise ValueError(f"At most {MARKER_LEVELS * MARKER_LEVELS} identities are supported")
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    width, height = size
+    start = time.perf_counter()
+    for i in range(images):
+        # Low-resolution noise scaled up gives JPEG something realistic to compress
+        image = cv2.resize(rng.integers(0, 256, (height // 16, width // 16, 3), dtype=np.uint8), (width, height))
+        # Images without a face get a black marker so noise can never read as one
+        marker = (0, 0, 0)
+        if rng.random() >= no_face_ratio:
+            identity = int(rng.integers(identities))
+            marker = (identity // MARKER_LEVELS * MARKER_STEP, identity % MARKER_LEVELS * MARKER_STEP,
+                      (MARKER_LEVELS - 1) * MARKER_STEP)
+        half = max(16, min(width, height) // 10)
+        image[height // 2 - half:height // 2 + half, width // 2 - half:width // 2 + half] = marker
+        cv2.imwrite(os.path.join(corpus_dir, f"img_{i:06d}.jpg"), image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+    with open(spec_path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f)
+    logger.info(f"Generated {images} benchmark images in {corpus_dir} in {time.perf_counter() - start:.1f}s")
+    return spec
+
+
+def run_benchmark(source_folder, work_dir, model='stub', runs=1, rerun=False, stub_latency=0.0,
+                  placement_workers=None):
+    """
+    Run the pipeline over source_folder and collect one run report per run.
+
+    Every run starts from an empty output folder; with rerun=True each is
+    followed by a second run into the same output to measure the incremental
+    path.
+
+    Returns:
+        List of RunMetrics reports
+    """
+    face_app = StubFaceApp(latency=stub_latency) if model == 'stub' else None
+    output_dir = os.path.join(work_dir, 'output')
+    reports = []
+    for run in range(runs):
+        shutil.rmtree(output_dir, ignore_errors=True)
+        for kind in (['cold', 'rerun'] if rerun else ['cold']):
+            metrics = RunMetrics(f"bench-{run + 1}-{kind}")
+            metrics.set_info('model', model)
+            metrics.set_info('kind', kind)
+            run_pipeline(source_folder, output_dir, placement_workers=placement_workers, face_app=face_app,
+                         metrics=metrics)
+            reports.append(metrics.report())
+    return reports
+
+
+def format_report(reports):
+    """Plain-text table of wall time per stage for each run."""
+    stages = []
+    for report in reports:
+        stages.extend(s for s in report['stages'] if s not in stages)
+    lines = [f"{'stage':<16}" + ''.join(f"{r['run_id']:>18}" for r in reports)]
+    for stage in stages:
+        cells = ''.join(f"{r['stages'].get(stage, {}).get('wall_seconds', 0.0):>17.3f}s" for r in reports)
+        lines.append(f"{stage:<16}{cells}")
+    lines.append(f"{'images/s':<16}" + ''.join(f"{r['throughput']['images_per_second']:>18.1f}" for r in reports))
+    lines.append(f"{'peak RSS MB':<16}" + ''.join(f"{(r['peak_rss_bytes'] or 0) / 1e6:>18.0f}" for r in reports))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the face grouping pipeline end to end")
+    parser.add_argument('--images', type=int, default=500, help="Number of synthetic images")
+    parser.add_argument('--size', default='1280x960', help="Synthetic image size as WIDTHxHEIGHT")
+    parser.add_argument('--identities', type=int, default=20, help="Number of distinct people in the corpus")
+    parser.add_argument('--source', help="Benchmark this folder instead of a synthetic corpus")
+    parser.add_argument('--work-dir', default='benchmark_work', help="Folder for the corpus and the output")
+    parser.add_argument('--model', choices=['stub', 'real'], default='stub')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help="Seconds the stub model sleeps per image")
+    parser.add_argument('--runs', type=int, default=1)
+    parser.add_argument('--rerun', action='store_true', help="Also time an incremental rerun after each run")
+    parser.add_argument('--placement-workers', type=int)
+    parser.add_argument('--report', help="Write all run reports to this JSON file")
+    args = parser.parse_args(argv)
+
+    source_folder = args.source
+    spec = None
+    if source_folder is None:
+        width, height = (int(v) for v in args.size.lower().split('x'))
+        source_folder = os.path.join(args.work_dir, 'corpus')
+        spec = generate_corpus(source_folder, args.images, (width, height), args.identities)
+
+    reports = run_benchmark(source_folder, args.work_dir, args.model, args.runs, args.rerun, args.stub_latency,
+                            args.placement_workers)
+    print(format_report(reports))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'corpus': spec or {'source': source_folder}, 'runs': reports}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# checkpoint.py - Checkpoint and resume support for long pipeline runs
+import os
+import pickle
+import shutil
+import hashlib
+from .config import CHECKPOINT_EVERY
+from .logger import get_logger
+from .sources import VideoFrameSource, source_key
+
+logger = get_logger(__name__)
+
+RECORDS_FILE = 'records.pkl'
+STAGE_SUFFIX = '.done'
+
+
+def sources_digest(keys):
+    """Fingerprint of an ordered list of source keys, used to validate stage markers."""
+    digest = hashlib.sha1()
+    for key in keys:
+        digest.update(key.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def pack_detections(source, detections):
+    """
+    Detections of source in a form that holds no image data: faces found in
+    source itself refer to it as None, video frames by (video path, frame
+    index, timestamp). Uploads are therefore never written into a checkpoint.
+    """
+    if detections is None:
+        return None
+    packed = []
+    for detection_source, face in detections:
+        if isinstance(detection_source, VideoFrameSource):
+            ref = (detection_source.video_path, detection_source.frame_index, detection_source.timestamp)
+        elif detection_source is source:
+            ref = None
+        else:
+            ref = detection_source
+        packed.append((ref, face))
+    return packed
+
+
+def unpack_detections(source, packed):
+    """
+    Map packed detections back onto the live source (see pack_detections).
+
+    Returns:
+        List of (source, face) detections, or None for an unreadable image or
+        if a video frame can't be decoded again (the source should then be
+        processed afresh)
+    """
+    if packed is None:
+        return None
+    detections = []
+    for ref, face in packed:
+        if ref is None:
+            detection_source = source
+        elif isinstance(ref, tuple):
+            detection_source = VideoFrameSource.from_video(*ref)
+            if detection_source is None:
+                logger.warning(f"Can't read frame {ref[1]} of {ref[0]} again, processing it afresh")
+                return None
+        else:
+            detection_source = ref
+        detections.append((detection_source, face))
+    return detections
+
+
+class PipelineCheckpoint:
+    """
+    Persists detection results and stage completion for one output folder.
+
+    Detection results are appended to records.pkl in batches of `every`
+    images (one pickle frame per batch, fsynced), so a crash loses at most
+    one batch; a torn final frame is cut off on load. Finished stages are
+    recorded as <stage>.done files written via temp file + rename.
+    """
+
+    def __init__(self, checkpoint_dir, every=CHECKPOINT_EVERY):
+        self.checkpoint_dir = checkpoint_dir
+        self.every = max(1, every)
+        self._pending = []
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    @property
+    def records_path(self):
+        return os.path.join(self.checkpoint_dir, RECORDS_FILE)
+
+    def clear(self):
+        """Forget everything recorded so far (start a fresh run)."""
+        self._pending = []
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+    def load_records(self):
+        """
+        Returns:
+            Dict of source key -> packed detections (None for unreadable
+            images); see unpack_detections
+        """
+        records = {}
+        if not os.path.exists(self.records_path):
+            return records
+        with open(self.records_path, 'r+b') as f:
+            good = 0  # end of the last complete batch
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    break
+                except (pickle.UnpicklingError, ValueError, TypeError, AttributeError) as e:
+                    logger.warning(f"Ignoring truncated checkpoint batch: {e}")
+                    break
+                records.update(batch)
+                good = f.tell()
+            # Cut off a torn final batch, so batches flushed from now on follow the last good one
+            if good < os.fstat(f.fileno()).st_size:
+                f.truncate(good)
+                f.flush()
+                os.fsync(f.fileno())
+        logger.info(f"Loaded checkpoint with {len(records)} processed images from {self.checkpoint_dir}")
+        return records
+
+    def add(self, source, detections):
+        """Record the detections of one image or video; flushed every `every` sources."""
+        self._pending.append((source_key(source), pack_detections(source, detections)))
+        if len(self._pending) >= self.every:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        with open(self.records_path, 'ab') as f:
+            pickle.dump(dict(self._pending), f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = []
+
+    def mark_stage(self, name, payload=None):
+        """Atomically record that a stage finished, with an optional result."""
+        path = os.path.join(self.checkpoint_dir, name + STAGE_SUFFIX)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def stage_done(self, name):
+        return os.path.exists(os.path.join(self.checkpoint_dir, name + STAGE_SUFFIX))
+
+    def stage_result(self, name):
+        """Result stored with a finished stage, or None if it hasn't finished."""
+        path = os.path.join(self.checkpoint_dir, name + STAGE_SUFFIX)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def clear_stage(self, name):
+        path = os.path.join(self.checkpoint_dir, name + STAGE_SUFFIX)
+        if os.path.exists(path):
+            os.remove(path)
@@ -1,4 +1,68 @@
 import os
 
 IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
-FACE_SIZE = (160, 160)
\ No newline at end of file
+VIDEO_EXTENSIONS = ['.mp4', '.mov', '.avi', '.mkv', '.m4v', '.webm']
+FACE_SIZE = (160, 160)
+FACE_MODEL = 'buffalo_l'
+
+# File placement (copying into the output folders)
+PLACEMENT_WORKERS = 8
+PLACEMENT_RETRIES = 3
+PLACEMENT_RETRY_DELAY = 0.5
+
+# Background jobs: pipeline runs allowed at the same time per server
+MAX_CONCURRENT_JOBS = 4
+
+# Shared inference service: recognition batches across concurrent jobs
+INFERENCE_MAX_BATCH = 32
+INFERENCE_MAX_WAIT = 0.005
+
+# Google Drive downloads
+GDRIVE_DOWNLOAD_WORKERS = 8
+GDRIVE_DOWNLOAD_RETRIES = 4
+GDRIVE_RETRY_DELAY = 1.0
+GDRIVE_PAGE_SIZE = 1000
+
+# Decoding: worker processes decoding images ahead of detection (0 = decode in-process).
+# Decoded pixels are handed over through shared-memory slots of DECODE_SLOT_BYTES each.
+DECODE_WORKERS = 0
+DECODE_SLOT_BYTES = 72 * 1024 * 1024
+
+# Auto-tuning (run_pipeline(auto_tune=True)): calibration sample size and per-machine cache
+AUTOTUNE_SAMPLE_SIZE = 40
+AUTOTUNE_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'face_grouper', 'autotune.json')
+
+# Crop store (run_pipeline(crop_store_dir=...)): aligned face crop size and re-embedding batch size
+CROP_SIZE = 112
+REEMBED_BATCH_SIZE = 64
+
+# Progressive mode (run_pipeline(progressive=True)): share of the images grouped first for a preview
+PROGRESSIVE_SAMPLE_FRACTION = 0.05
+PROGRESSIVE_MIN_SAMPLE = 50
+
+# Checkpointing: flush detection results to disk every N images
+CHECKPOINT_EVERY = 500
+
+# Local HTTP API (python -m face_grouper.server)
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+SERVER_OUTPUT_ROOT = 'server_output'
+SERVER_MAX_REQUEST_BYTES = 512 * 1024 * 1024
+
+# Static HTML gallery (gallery.py): photos per person page
+GALLERY_PAGE_SIZE = 200
+
+# Face search: libraries with at least this many faces use an approximate (IVF) index
+SEARCH_IVF_MIN_FACES = 50000
+SEARCH_NPROBE = 8
+
+# Video ingestion: frames are sampled at VIDEO_SAMPLE_FPS ('rate'), or among those
+# only the ones starting a new scene ('scene'); near-identical frames are skipped
+VIDEO_SAMPLING = 'rate'
+VIDEO_SAMPLE_FPS = 2.0
+VIDEO_SCENE_THRESHOLD = 0.3
+VIDEO_SCENE_MAX_INTERVAL = 10.0
+VIDEO_DUPLICATE_THRESHOLD = 3.0
+# Detections in consecutive sampled frames are one track if similar enough and close in time
+VIDEO_TRACK_SIMILARITY = 0.5
+VIDEO_TRACK_MAX_GAP = 2.0
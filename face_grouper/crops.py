@@ -0,0 +1,225 @@
+# crops.py - Packed store of aligned face crops, for re-embedding without decoding the originals
+#
+#   python -m face_grouper.crops reembed output/.crops --model antelopev2 --output embeddings.npy
+#
+# run_pipeline(..., crop_store_dir=...) saves every detected face as an aligned
+# 112x112 crop into one uint8 array on disk; a recognition model can then be run
+# over that array directly, which reads a few KB per face instead of whole photos.
+import os
+import json
+import shutil
+import argparse
+import cv2
+import numpy as np
+from insightface.utils import face_align
+from .config import CROP_SIZE, FACE_MODEL, REEMBED_BATCH_SIZE
+from .detector import create_face_app
+from .logger import get_logger
+from .sources import source_key
+
+logger = get_logger(__name__)
+
+CROPS_FILE = 'crops.u8'
+INDEX_FILE = 'index.jsonl'
+META_FILE = 'store.json'
+EMBEDDINGS_FILE = 'embeddings.npy'
+
+
+def align_face(image, face, size=CROP_SIZE):
+    """
+    The face cropped and aligned the way recognition models expect it.
+
+    Uses the five landmarks (ArcFace alignment); faces without landmarks
+    fall back to their bounding box, squared and resized.
+    """
+    if getattr(face, 'kps', None) is not None:
+        return face_align.norm_crop(image, landmark=face.kps, image_size=size)
+    x1, y1, x2, y2 = (float(v) for v in face.bbox[:4])
+    half = max(x2 - x1, y2 - y1) / 2
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    h, w = image.shape[:2]
+    x1, y1 = max(0, int(cx - half)), max(0, int(cy - half))
+    x2, y2 = min(w, int(cx + half)), min(h, int(cy + half))
+    if x2 <= x1 or y2 <= y1:
+        return np.zeros((size, size, 3), dtype=np.uint8)
+    return cv2.resize(image[y1:y2, x1:x2], (size, size), interpolation=cv2.INTER_AREA)
+
+
+class CropStore:
+    """
+    Appends aligned face crops to one packed file: crops.u8 holds the pixels
+    of N crops back to back (memory-mappable as uint8 (N, size, size, 3)),
+    index.jsonl one line per crop with the source key, the face's position in
+    that source's detections and its bounding box.
+
+    Crops are written before their index line, so after a crash the store is
+    cut back to the crops that have an index line. Opening an existing store
+    appends to it (sources already in it are skipped, e.g. when resuming);
+    clear() starts over.
+    """
+
+    def __init__(self, store_dir, size=CROP_SIZE):
+        self.store_dir = store_dir
+        self.size = size
+        self.crop_bytes = size * size * 3
+        os.makedirs(store_dir, exist_ok=True)
+        self._open()
+
+    def _open(self):
+        meta_path = os.path.join(self.store_dir, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                stored_size = json.load(f)['size']
+            if stored_size != self.size:
+                raise ValueError(f"{self.store_dir} holds {stored_size}px crops, not {self.size}px")
+        else:
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'size': self.size}, f)
+
+        index_path = os.path.join(self.store_dir, INDEX_FILE)
+        crops_path = os.path.join(self.store_dir, CROPS_FILE)
+        entries = []
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        break  # torn last line
+        crops_size = os.path.getsize(crops_path) if os.path.exists(crops_path) else 0
+        self.count = min(len(entries), crops_size // self.crop_bytes)
+        self._keys = {entry['source'] for entry in entries[:self.count]}
+
+        # Drop anything written after the last complete crop + index line
+        with open(index_path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(entry) + '\n' for entry in entries[:self.count])
+        self._crops = open(crops_path, 'ab')
+        self._crops.truncate(self.count * self.crop_bytes)
+        self._index = open(index_path, 'a', encoding='utf-8')
+
+    def __contains__(self, source):
+        return source_key(source) in self._keys
+
+    def add(self, source, items):
+        """
+        Store the aligned crops of the faces detected in one image or video.
+
+        Args:
+            source: The image or video the faces were detected in
+            items: (image, face) pairs in the order of the source's
+                detections, image being the decoded image (or video frame)
+                holding the face
+        """
+        key = source_key(source)
+        if not items or key in self._keys:
+            return
+        crops = np.stack([align_face(image, face, self.size) for image, face in items])
+        self._crops.write(np.ascontiguousarray(crops, dtype=np.uint8).tobytes())
+        self._crops.flush()
+        for i, (_, face) in enumerate(items):
+            self._index.write(json.dumps({'source': key, 'face': i,
+                                          'bbox': [round(float(v), 1) for v in face.bbox[:4]]}) + '\n')
+        self._index.flush()
+        self._keys.add(key)
+        self.count += len(items)
+
+    def clear(self):
+        self.close()
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+        os.makedirs(self.store_dir)
+        self._open()
+
+    def close(self):
+        self._crops.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_crop_store(store_dir):
+    """
+    Open a crop store for reading.
+
+    Returns:
+        (crops, entries): crops a read-only uint8 memmap of shape
+        (N, size, size, 3), entries the N index dicts ('source', 'face', 'bbox')
+    """
+    with open(os.path.join(store_dir, META_FILE), 'r', encoding='utf-8') as f:
+        size = json.load(f)['size']
+    entries = []
+    with open(os.path.join(store_dir, INDEX_FILE), 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+    crops_path = os.path.join(store_dir, CROPS_FILE)
+    count = min(len(entries), os.path.getsize(crops_path) // (size * size * 3))
+    if count == 0:
+        return np.zeros((0, size, size, 3), dtype=np.uint8), []
+    crops = np.memmap(crops_path, dtype=np.uint8, mode='r', shape=(count, size, size, 3))
+    return crops, entries[:count]
+
+
+def reembed_crops(store_dir, recognizer=None, model_name=FACE_MODEL, batch_size=REEMBED_BATCH_SIZE,
+                  output_path=None):
+    """
+    Run a recognition model over every crop in the store.
+
+    Args:
+        store_dir: Crop store directory
+        recognizer: Recognition model with get_feat(list of crops) (default:
+            the recognition model of model_name)
+        model_name: InsightFace model pack to take the recognition model from
+        batch_size: Crops per model call
+        output_path: Where to save the (N, dim) float32 embeddings, in index
+            order (default: store_dir/embeddings.npy)
+
+    Returns:
+        (embeddings, entries) with the embeddings L2-normalized
+    """
+    crops, entries = load_crop_store(store_dir)
+    if recognizer is None:
+        recognizer = create_face_app(model_name).models['recognition']
+    size = getattr(recognizer, 'input_size', (crops.shape[1],))[0]
+
+    embeddings = []
+    for start in range(0, len(crops), batch_size):
+        batch = [np.asarray(crop) for crop in crops[start:start + batch_size]]
+        if size != crops.shape[1]:
+            batch = [cv2.resize(crop, (size, size), interpolation=cv2.INTER_LINEAR) for crop in batch]
+        embeddings.append(np.asarray(recognizer.get_feat(batch), dtype=np.float32).reshape(len(batch), -1))
+    if embeddings:
+        embeddings = np.concatenate(embeddings)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    else:
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+
+    output_path = output_path or os.path.join(store_dir, EMBEDDINGS_FILE)
+    np.save(output_path, embeddings)
+    logger.info(f"Re-embedded {len(entries)} faces from {store_dir} into {output_path}")
+    return embeddings, entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Work with a store of aligned face crops")
+    commands = parser.add_subparsers(dest='command', required=True)
+    reembed = commands.add_parser('reembed', help="Run a recognition model over the stored crops")
+    reembed.add_argument('store', help="Crop store directory (run_pipeline's crop_store_dir)")
+    reembed.add_argument('--model', default=FACE_MODEL, help="InsightFace model pack to take the recognition model from")
+    reembed.add_argument('--batch-size', type=int, default=REEMBED_BATCH_SIZE)
+    reembed.add_argument('--output', help="Embeddings file to write (default: <store>/embeddings.npy)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'reembed':
+        embeddings, _ = reembed_crops(args.store, model_name=args.model, batch_size=args.batch_size,
+                                      output_path=args.output)
+        print(f"{embeddings.shape[0]} embeddings of dimension {embeddings.shape[1] if embeddings.size else 0}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,101 @@
 # detector.py - Enhanced with face alignment and better embedding extraction  
+import os
+import queue
+import threading
+from contextlib import ExitStack, contextmanager
 import cv2
 import numpy as np
 from insightface.app import FaceAnalysis
-from .config import FACE_SIZE
+from .config import FACE_SIZE, FACE_MODEL
 import logging
 
 logger = logging.getLogger(__name__)
 
-face_app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
-face_app.prepare(ctx_id=0)
+_default_face_app = None
+_default_face_app_lock = threading.Lock()
 
-def detect_faces(image):
-    return face_app.get(image)
+def create_face_app(model_name=FACE_MODEL, intra_op_threads=None):
+    """
+    Load and prepare a new InsightFace model instance.
+
+    intra_op_threads limits the threads ONNX Runtime uses per model call
+    (default: ONNX Runtime's choice, one per core).
+    """
+    kwargs = {}
+    if intra_op_threads:
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        kwargs['sess_options'] = options
+    app = FaceAnalysis(name=model_name, providers=['CPUExecutionProvider'], **kwargs)
+    app.prepare(ctx_id=0)
+    # Identifies the model, e.g. in stage cache fingerprints (see artifacts.py)
+    app.model_name = model_name
+    return app
+
+def get_face_app():
+    """Process-wide default model, loaded on first use."""
+    global _default_face_app
+    with _default_face_app_lock:
+        if _default_face_app is None:
+            _default_face_app = create_face_app()
+        return _default_face_app
+
+class FaceAppPool:
+    """
+    A fixed-size pool of model instances shared by concurrent pipeline runs.
+
+    InsightFace models aren't safe for concurrent calls, so each caller
+    borrows an instance for the duration of one call. Instances are loaded
+    lazily, only when more callers are active than instances exist.
+    The pool exposes get(image) and can be used wherever a face_app is expected.
+    """
+
+    def __init__(self, size=None, model_name=FACE_MODEL):
+        self.size = size or os.cpu_count() or 1
+        self.model_name = model_name
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def borrow(self):
+        """Borrow a model instance, waiting for one if the pool is exhausted."""
+        app = None
+        try:
+            app = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    app = create_face_app(self.model_name)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                logger.info(f"Loaded model instance {self._created}/{self.size} into the pool")
+            else:
+                app = self._idle.get()
+        try:
+            yield app
+        finally:
+            self._idle.put(app)
+
+    def warm_up(self, count=1):
+        """Load up to count instances now, so the first calls don't pay for model loading."""
+        with ExitStack() as stack:
+            for _ in range(min(count, self.size)):
+                stack.enter_context(self.borrow())
+
+    def get(self, image):
+        with self.borrow() as app:
+            return app.get(image)
+
+def detect_faces(image, face_app=None):
+    return (face_app or get_face_app()).get(image)
 
 def extract_face_embedding(face):
     return face.normed_embedding
@@ -90,7 +174,7 @@ def align_face(image, landmarks, target_size=(112, 112)):
         logger.warning(f"Face alignment failed: {e}")
         return None
 
-def extract_enhanced_embedding(face, image):
+def extract_enhanced_embedding(face, image, face_app=None):
     """
     Extract high-quality face embedding with alignment preprocessing.
     This improves clustering accuracy by normalizing face pose and lighting.
@@ -98,6 +182,7 @@ def extract_enhanced_embedding(face, image):
     Args:
         face: InsightFace detection object
         image: Original image
+        face_app: Model (or FaceAppPool) to use - default is the shared model
         
     Returns:
         Enhanced face embedding or None if extraction fails
@@ -108,7 +193,7 @@ def extract_enhanced_embedding(face, image):
             aligned_face = align_face(image, face.landmark_2d_106)
             if aligned_face is not None:
                 # Re-detect face in aligned image for better embedding
-                aligned_faces = face_app.get(aligned_face)
+                aligned_faces = (face_app or get_face_app()).get(aligned_face)
                 if aligned_faces:
                     aligned_embedding = aligned_faces[0].normed_embedding
                     logger.debug("Using aligned face embedding")
@@ -0,0 +1,135 @@
+# discovery.py - Streaming discovery of the images in a source folder
+import os
+import queue
+import fnmatch
+import threading
+from collections import namedtuple
+from .config import IMAGE_EXTENSIONS, VIDEO_EXTENSIONS
+from .logger import get_logger
+from .sources import ScannedPath
+
+logger = get_logger(__name__)
+
+ImageEntry = namedtuple('ImageEntry', ['path', 'size', 'mtime_ns'])
+
+MEDIA_EXTENSIONS = IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+
+_DONE = object()
+
+
+def _matches(rel_path, name, patterns):
+    """True if rel_path (or just its name) matches one of the glob patterns."""
+    return any(fnmatch.fnmatch(rel_path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+
+def scan_images(folder, include=None, exclude=None, max_depth=None, extensions=MEDIA_EXTENSIONS):
+    """
+    Yield the images below folder as they are found, using os.scandir.
+
+    Unlike os.walk nothing is collected up front, so the first images are
+    available immediately even for very large trees. Size and mtime come
+    from the directory entry (free on Windows, one stat per image elsewhere).
+    Directories that can't be read are logged and skipped.
+
+    Args:
+        folder: Root folder to scan
+        include: Optional glob patterns; only images whose path relative to
+            folder (or file name) matches one of them are yielded
+        exclude: Optional glob patterns for files and directories to skip;
+            excluded directories are not descended into
+        max_depth: How many directory levels below folder to descend
+            (0 = only folder itself, default: unlimited)
+        extensions: File extensions to accept (default: images and videos)
+
+    Yields:
+        ImageEntry(path, size, mtime_ns) tuples
+    """
+    include = list(include or [])
+    exclude = list(exclude or [])
+    extensions = {ext.lower() for ext in extensions}
+
+    # Depth-first with an explicit stack so deep trees don't hit the recursion limit
+    stack = [(folder, '', 0)]
+    while stack:
+        path, rel_dir, depth = stack.pop()
+        try:
+            with os.scandir(path) as entries:
+                subdirs = []
+                for entry in entries:
+                    rel_path = f"{rel_dir}{entry.name}"
+                    if exclude and _matches(rel_path, entry.name, exclude):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if max_depth is None or depth < max_depth:
+                                subdirs.append((entry.path, f"{rel_path}/", depth + 1))
+                            continue
+                        if not entry.is_file():
+                            continue
+                        if os.path.splitext(entry.name)[1].lower() not in extensions:
+                            continue
+                        if include and not _matches(rel_path, entry.name, include):
+                            continue
+                        stat = entry.stat()
+                    except OSError as e:
+                        logger.warning(f"Skipping {entry.path}: {e}")
+                        continue
+                    yield ImageEntry(entry.path, stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            logger.warning(f"Can't scan {path}: {e}")
+            continue
+        # Reversed so subdirectories are visited in the order they were listed
+        stack.extend(reversed(subdirs))
+
+
+class DiscoveryStream:
+    """
+    Scans a source folder on a background thread and yields image paths as
+    they are found, so detection can start while the scan is still running.
+    The paths are ScannedPaths carrying the size and mtime from the scan.
+
+    found counts the images discovered so far; total stays None until the
+    scan has finished and then holds the final count.
+    Iterate it once, e.g. run_pipeline(folder, output, sources=stream).
+    """
+
+    def __init__(self, folder, include=None, exclude=None, max_depth=None, extensions=MEDIA_EXTENSIONS):
+        self.folder = folder
+        self.include = include
+        self.exclude = exclude
+        self.max_depth = max_depth
+        self.extensions = extensions
+        self.found = 0
+        self.total = None
+
+    def _scan(self, results, stop):
+        try:
+            for entry in scan_images(self.folder, self.include, self.exclude, self.max_depth, self.extensions):
+                if stop.is_set():
+                    return
+                self.found += 1
+                results.put(entry)
+            self.total = self.found
+            logger.info(f"Discovered {self.total} images in {self.folder}")
+        except BaseException as e:
+            results.put(e)
+        finally:
+            results.put(_DONE)
+
+    def __iter__(self):
+        results = queue.Queue()
+        stop = threading.Event()
+        scanner = threading.Thread(target=self._scan, args=(results, stop), name='face-grouper-discovery',
+                                   daemon=True)
+        scanner.start()
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield ScannedPath(*item)
+        finally:
+            # Stop scanning if the consumer stopped early (e.g. cancellation)
+            stop.set()
@@ -0,0 +1,187 @@
+# gallery.py - Static HTML gallery of a grouped output folder
+#
+#   python -m face_grouper.gallery OUTPUT_FOLDER
+#
+# Writes OUTPUT_FOLDER/gallery/index.html: an overview of all people and one set of
+# paginated pages per person. The pages are plain HTML with relative links, so the
+# output folder can be opened from disk or served by any static file server.
+import os
+import html
+import shutil
+import argparse
+from urllib.parse import quote
+from .atlas import load_atlas_index, ATLAS_DIR
+from .config import GALLERY_PAGE_SIZE
+from .logger import get_logger
+from .results import load_results_index
+
+logger = get_logger(__name__)
+
+GALLERY_DIR = 'gallery'
+BUILD_SUFFIX = '-new'
+PREVIOUS_SUFFIX = '-prev'
+
+STYLE = """
+body { font-family: sans-serif; margin: 1.5em; background: #fafafa; color: #222; }
+a { color: #1a5fb4; text-decoration: none; }
+.grid { display: flex; flex-wrap: wrap; gap: 12px; }
+.person { text-align: center; font-size: 0.85em; }
+.thumb { display: block; background-color: #ddd; }
+.photo { display: inline-block; margin: 4px; background: #ddd; vertical-align: top; }
+.photo img { display: block; max-width: 100%; height: auto; }
+.pages { margin: 1em 0; }
+.pages a, .pages span { margin-right: 0.5em; }
+"""
+
+
+def _url(*parts):
+    """Relative URL from a gallery page to a file in the output folder."""
+    return '../' + '/'.join(quote(part.replace(os.sep, '/')) for part in parts)
+
+
+def _page_name(folder, page):
+    return f"{folder}.html" if page == 1 else f"{folder}-{page}.html"
+
+
+def _document(title, body):
+    return (f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">"
+            f"<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">"
+            f"<title>{html.escape(title)}</title><style>{STYLE}</style></head>\n"
+            f"<body>\n{body}\n</body></html>\n")
+
+
+def _overview_tile(group, atlas, tile_size):
+    """The thumbnail of a group: a tile of the sprite-sheet atlas, or its own thumbnail.jpg."""
+    width, height = tile_size
+    size = f"width: {width}px; height: {height}px"
+    tile = atlas['tiles'].get(group['folder']) if atlas else None
+    if tile is not None:
+        sheet = _url(ATLAS_DIR, atlas['sheets'][tile['sheet']])
+        return (f"<span class=\"thumb\" style=\"{size}; background-image: url('{sheet}'); "
+                f"background-position: -{tile['x']}px -{tile['y']}px\"></span>")
+    if group['thumbnail']:
+        return (f"<img class=\"thumb\" src=\"{_url(group['thumbnail'])}\" width=\"{width}\" height=\"{height}\" "
+                f"loading=\"lazy\" alt=\"\">")
+    return f"<span class=\"thumb\" style=\"{size}\"></span>"
+
+
+def _photo(folder, name, previews, preview_size):
+    """One photo linking to the original, showing its preview with the preview's own size."""
+    preview = previews.get(name)
+    if preview is not None:
+        width, height = preview['size']
+        src = _url(preview['path'])
+    else:
+        width = height = preview_size
+        src = _url(folder, name)
+    return (f"<a class=\"photo\" href=\"{_url(folder, name)}\" title=\"{html.escape(name)}\">"
+            f"<img src=\"{src}\" width=\"{width}\" height=\"{height}\" loading=\"lazy\" decoding=\"async\" "
+            f"alt=\"{html.escape(name)}\"></a>")
+
+
+def _pagination(folder, page, pages):
+    if pages == 1:
+        return ''
+    links = []
+    for number in range(1, pages + 1):
+        if number == page:
+            links.append(f"<span>{number}</span>")
+        else:
+            links.append(f"<a href=\"{quote(_page_name(folder, number))}\">{number}</a>")
+    return f"<div class=\"pages\">{''.join(links)}</div>"
+
+
+def _write_group_pages(gallery_dir, title, folder, files, previews, page_size, preview_size):
+    pages = max(1, -(-len(files) // page_size))
+    for page in range(1, pages + 1):
+        photos = '\n'.join(_photo(folder, name, previews, preview_size)
+                           for name in files[(page - 1) * page_size:page * page_size])
+        navigation = _pagination(folder, page, pages)
+        body = (f"<p><a href=\"index.html\">&larr; All people</a></p>\n"
+                f"<h1>{html.escape(title)}</h1><p>{len(files)} photos</p>\n"
+                f"{navigation}\n<div>\n{photos}\n</div>\n{navigation}")
+        with open(os.path.join(gallery_dir, _page_name(folder, page)), 'w', encoding='utf-8') as f:
+            f.write(_document(title, body))
+    return pages
+
+
+def export_gallery(output_dir, index=None, page_size=GALLERY_PAGE_SIZE, preview_size=400, thumbnail_size=(150, 150)):
+    """
+    Write a static HTML gallery of output_dir into output_dir/gallery.
+
+    The overview shows every person from the thumbnail atlas (a few sprite
+    sheets instead of one request per person). Person pages hold page_size
+    photos each. They show the downscaled previews with their stored sizes,
+    so the layout doesn't shift, and the images load lazily
+    (loading="lazy"). The gallery is built next to the live one and swapped
+    in with a rename.
+
+    Args:
+        output_dir: Output directory path
+        index: Results index (see results.py); loaded if not given
+        page_size: Photos per person page
+        preview_size: Box size for photos without a preview
+        thumbnail_size: Size of the person thumbnails as (width, height) when
+            there is no atlas; otherwise the atlas's tile size is used
+
+    Returns:
+        Path of the gallery's index.html
+    """
+    index = index or load_results_index(output_dir)
+    previews = index.get('previews', {})
+    atlas = load_atlas_index(output_dir)
+    tile_size = atlas['tile_size'] if atlas else thumbnail_size
+
+    gallery_dir = os.path.join(output_dir, GALLERY_DIR)
+    build_dir = gallery_dir + BUILD_SUFFIX
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+
+    tiles = []
+    page_count = 1
+    for group in index['groups']:
+        title = group['folder'].replace('_', ' ').capitalize()
+        page_count += _write_group_pages(build_dir, title, group['folder'], group['files'], previews,
+                                         page_size, preview_size)
+        tiles.append(f"<a class=\"person\" href=\"{quote(_page_name(group['folder'], 1))}\" "
+                     f"style=\"width: {tile_size[0]}px\">{_overview_tile(group, atlas, tile_size)}"
+                     f"{html.escape(title)} ({group['count']})</a>")
+
+    no_faces = index.get('no_faces') or {}
+    no_faces_link = ''
+    if no_faces.get('count'):
+        page_count += _write_group_pages(build_dir, "No faces found", no_faces['folder'], no_faces['files'],
+                                         previews, page_size, preview_size)
+        no_faces_link = (f"<p><a href=\"{quote(_page_name(no_faces['folder'], 1))}\">"
+                         f"{no_faces['count']} photos without faces</a></p>")
+
+    body = (f"<h1>Face groups</h1><p>{len(index['groups'])} people</p>\n{no_faces_link}\n"
+            f"<div class=\"grid\">\n" + '\n'.join(tiles) + "\n</div>")
+    with open(os.path.join(build_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(_document("Face groups", body))
+
+    previous_dir = gallery_dir + PREVIOUS_SUFFIX
+    # A gallery-prev left by an interrupted swap would make the rename fail
+    shutil.rmtree(previous_dir, ignore_errors=True)
+    if os.path.exists(gallery_dir):
+        os.rename(gallery_dir, previous_dir)
+    os.rename(build_dir, gallery_dir)
+    shutil.rmtree(previous_dir, ignore_errors=True)
+    logger.info(f"Exported gallery with {len(index['groups'])} people in {page_count} pages to {gallery_dir}")
+    return os.path.join(gallery_dir, 'index.html')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a static HTML gallery of a grouped output folder")
+    parser.add_argument('output', help="Output folder written by the pipeline")
+    parser.add_argument('--page-size', type=int, default=GALLERY_PAGE_SIZE, help="Photos per person page")
+    args = parser.parse_args(argv)
+
+    index = load_results_index(args.output)
+    if index is None:
+        parser.error(f"{args.output} is not an output folder")
+    print(export_gallery(args.output, index, args.page_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,246 @@
-from pydrive.auth import GoogleAuth
-from pydrive.drive import GoogleDrive
 import os
 import re
+import copy
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .config import GDRIVE_DOWNLOAD_WORKERS, GDRIVE_DOWNLOAD_RETRIES, GDRIVE_RETRY_DELAY, GDRIVE_PAGE_SIZE
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+CLIENT_SECRETS_FILE = "client_secret_495485308500-k25o2ciaqpt2dcm7k21hsq83b9732e4g.apps.googleusercontent.com.json"
+PARTIAL_SUFFIX = '.part'
 
 def extract_folder_id_from_url(url):
     match = re.search(r'/folders/([a-zA-Z0-9_-]+)', url)
     return match.group(1) if match else url
 
-def download_gdrive_folder(folder_url_or_id, dest, progress_callback=None):
+def authenticate_drive():
+    """Authenticate with Google and return a GoogleDrive client."""
     from pydrive.auth import GoogleAuth
     from pydrive.drive import GoogleDrive
 
-    folder_id = extract_folder_id_from_url(folder_url_or_id)
     gauth = GoogleAuth()
-    gauth.LoadClientConfigFile("client_secret_495485308500-k25o2ciaqpt2dcm7k21hsq83b9732e4g.apps.googleusercontent.com.json")
+    gauth.LoadClientConfigFile(CLIENT_SECRETS_FILE)
     gauth.LocalWebserverAuth()
-    drive = GoogleDrive(gauth)
+    return GoogleDrive(gauth)
+
+def thread_auth(auth):
+    """
+    A GoogleAuth with its own copy of auth's credentials and its own
+    httplib2 Http. PyDrive downloads every file through its auth's single
+    Http, which is not thread-safe, so each download thread needs one of
+    these (token refreshes then also stay per thread).
+    """
+    from oauth2client.client import Credentials
+    from pydrive.auth import GoogleAuth
+
+    local = GoogleAuth()
+    local.settings = auth.settings
+    local.credentials = Credentials.new_from_json(auth.credentials.to_json())
+    if local.access_token_expired:
+        local.Refresh()
+    local.Authorize()
+    return local
+
+def list_folder_images(drive, folder_id, page_size=GDRIVE_PAGE_SIZE):
+    """
+    List the image files in a Drive folder, following every result page.
+
+    Args:
+        drive: GoogleDrive client, or any object whose ListFile(params) returns
+            an iterable of pages (lists of dict-like files with 'title',
+            'mimeType' and optionally 'fileSize'/'md5Checksum')
+        folder_id: Drive folder id
+        page_size: Files requested per page
+
+    Returns:
+        List of image file entries
+    """
+    query = {'q': f"'{folder_id}' in parents and trashed=false", 'maxResults': page_size}
+    images, skipped = [], 0
+    for page in drive.ListFile(query):
+        for file in page:
+            if file.get('mimeType', '').startswith('image/'):
+                images.append(file)
+            else:
+                skipped += 1
+    logger.info(f"Found {len(images)} images in Drive folder {folder_id} ({skipped} non-image files skipped)")
+    return images
+
+def file_md5(path, chunk_size=1 << 20):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def is_up_to_date(file, path):
+    """True if path already holds this Drive file (same size and md5 checksum)."""
+    if not os.path.exists(path):
+        return False
+    size = file.get('fileSize')
+    if size is not None and os.path.getsize(path) != int(size):
+        return False
+    checksum = file.get('md5Checksum')
+    if checksum is None:
+        return size is not None
+    return file_md5(path) == checksum
+
+def local_filenames(files):
+    """
+    Local file name for each Drive file, in the same order.
+
+    Drive allows several files with the same title in one folder; those all
+    get their file id appended, so they never share a destination (or a
+    .part file) and each keeps the same name on every run. Titles are
+    compared case-insensitively for case-insensitive file systems.
+    """
+    counts = {}
+    for file in files:
+        counts[file['title'].lower()] = counts.get(file['title'].lower(), 0) + 1
+    names = []
+    for file in files:
+        title = file['title']
+        if counts[title.lower()] > 1:
+            stem, ext = os.path.splitext(title)
+            title = f"{stem}_{file['id']}{ext}"
+        names.append(title)
+    return names
 
-    os.makedirs(dest, exist_ok=True)
+def download_file(file, path, retries=GDRIVE_DOWNLOAD_RETRIES, retry_delay=GDRIVE_RETRY_DELAY):
+    """
+    Download one Drive file to path via a temporary .part file and a rename,
+    so an interrupted download never leaves a truncated image behind.
+    Failures are retried with exponential backoff.
+    """
+    tmp_path = path + PARTIAL_SUFFIX
+    attempt = 0
+    while True:
+        try:
+            file.GetContentFile(tmp_path)
+            checksum = file.get('md5Checksum')
+            if checksum is not None and file_md5(tmp_path) != checksum:
+                raise IOError(f"Checksum mismatch for {file['title']}")
+            os.replace(tmp_path, path)
+            return path
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if attempt >= retries:
+                raise
+            delay = retry_delay * (2 ** attempt)
+            logger.warning(f"Download of {file['title']} failed ({e}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            attempt += 1
 
-    file_list = drive.ListFile({'q': f"'{folder_id}' in parents and trashed=false"}).GetList()
-    total_files = len(file_list)
+class GDriveDownloadStream:
+    """
+    Downloads a Drive folder in the background and yields each local path as
+    soon as its file has landed, so detection can start on the first images
+    while the rest are still downloading.
+
+    The folder is listed when iteration starts; from then on total holds the
+    number of images and done the number already available locally. Missing
+    files start downloading before the ones already on disk are yielded, so
+    downloads overlap detection of the local files too. A file that still
+    fails after its retries is skipped and counted in failed.
+    Each download thread talks to Drive through its own auth (see
+    thread_auth). Iterate it once, e.g. run_pipeline(dest, output, sources=stream).
+    """
+
+    def __init__(self, folder_url_or_id, dest, drive=None,
+                 max_workers=GDRIVE_DOWNLOAD_WORKERS, retries=GDRIVE_DOWNLOAD_RETRIES):
+        self.folder_id = extract_folder_id_from_url(folder_url_or_id)
+        self.dest = dest
+        self.drive = drive
+        self.max_workers = max_workers
+        self.retries = retries
+        self.total = None
+        self.done = 0
+        self.failed = 0
+        self._local = threading.local()
+
+    def _download(self, file, path):
+        """download_file on a worker thread, with the file bound to that thread's own Drive auth."""
+        auth = getattr(file, 'auth', None)
+        if getattr(auth, 'credentials', None) is not None:
+            if getattr(self._local, 'auth', None) is None:
+                self._local.auth = thread_auth(auth)
+            file = copy.copy(file)
+            file.auth = self._local.auth
+        return download_file(file, path, self.retries)
+
+    def __iter__(self):
+        if self.drive is None:
+            self.drive = authenticate_drive()
+        os.makedirs(self.dest, exist_ok=True)
+
+        file_list = list_folder_images(self.drive, self.folder_id)
+        self.total = len(file_list)
+
+        local, pending = [], []
+        for file, name in zip(file_list, local_filenames(file_list)):
+            filename = os.path.join(self.dest, name)
+            if is_up_to_date(file, filename):
+                local.append(filename)
+            else:
+                pending.append((file, filename))
+        logger.info(f"{len(local)} files already downloaded, {len(pending)} to fetch")
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {executor.submit(self._download, file, filename): file for file, filename in pending}
+            for filename in local:
+                self.done += 1
+                yield filename
+            for future in as_completed(futures):
+                try:
+                    path = future.result()
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning(f"Skipping {futures[future]['title']}: download failed ({e})")
+                    continue
+                self.done += 1
+                yield path
+            if self.failed:
+                logger.warning(f"{self.failed} of {self.total} files could not be downloaded")
+        finally:
+            # Stop queued downloads if one failed or the consumer stopped early (e.g. cancellation)
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def download_gdrive_folder(folder_url_or_id, dest, progress_callback=None, drive=None,
+                           max_workers=GDRIVE_DOWNLOAD_WORKERS, retries=GDRIVE_DOWNLOAD_RETRIES):
+    """
+    Download the images of a Google Drive folder into dest.
+
+    Files already present with a matching size/md5 are skipped, so rerunning
+    after an interruption only fetches what is missing. Downloads run on a
+    thread pool and each one is retried with backoff.
+    Use GDriveDownloadStream instead to process files while they download.
+
+    Args:
+        folder_url_or_id: Folder URL or id
+        dest: Local destination folder
+        progress_callback: Optional callable receiving the completed fraction
+        drive: Drive client to use (default: authenticate interactively)
+        max_workers: Concurrent downloads
+        retries: Retries per file
+
+    Returns:
+        List of local paths of the folder's images (files that failed to
+        download are left out)
+    """
+    stream = GDriveDownloadStream(folder_url_or_id, dest, drive, max_workers, retries)
 
     paths = []
-    for i, file in enumerate(file_list):
-        filename = os.path.join(dest, file['title'])
-        file.GetContentFile(filename)
-        paths.append(filename)
+    for path in stream:
+        paths.append(path)
 
         # Update progress if callback is provided
         if progress_callback:
-            progress_callback((i + 1) / total_files)
+            progress_callback(stream.done / stream.total)
 
     return paths
-
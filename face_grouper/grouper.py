@@ -3,6 +3,7 @@ from sklearn.cluster import DBSCAN
 import numpy as np
 from scipy.spatial.distance import cosine
 import logging
+from .metrics import measure
 
 logger = logging.getLogger(__name__)
 
@@ -10,7 +11,7 @@ def calculate_cosine_similarity(embedding1, embedding2):
     """Calculate cosine similarity between two embeddings."""
     return 1 - cosine(embedding1, embedding2)
 
-def cluster_faces(embeddings, eps=0.6, min_samples=1, merge_threshold=0.7):
+def cluster_faces(embeddings, eps=0.6, min_samples=1, merge_threshold=0.7, metrics=None):
     """
     Enhanced face clustering with better parameters and post-processing.
     
@@ -19,6 +20,7 @@ def cluster_faces(embeddings, eps=0.6, min_samples=1, merge_threshold=0.7):
         eps: DBSCAN epsilon parameter (increased from 0.5 to 0.6 for better grouping)
         min_samples: Minimum samples per cluster (kept at 1 for face clustering)
         merge_threshold: Threshold for merging similar clusters (0.7 = 70% similarity)
+        metrics: Optional RunMetrics to record DBSCAN and merge timings in
     
     Returns:
         Array of cluster labels with post-processing applied
@@ -31,14 +33,18 @@ def cluster_faces(embeddings, eps=0.6, min_samples=1, merge_threshold=0.7):
     # Step 1: Initial DBSCAN clustering with relaxed parameters
     logger.info(f"Running DBSCAN with eps={eps}, min_samples={min_samples}")
     clustering = DBSCAN(metric='cosine', eps=eps, min_samples=min_samples)
-    initial_labels = clustering.fit_predict(embeddings_array)
+    with measure(metrics, 'dbscan'):
+        initial_labels = clustering.fit_predict(embeddings_array)
     
     logger.info(f"Initial clustering: {len(set(initial_labels))} clusters found")
     
     # Step 2: Post-processing to merge similar clusters
-    merged_labels = merge_similar_clusters(embeddings_array, initial_labels, merge_threshold)
+    with measure(metrics, 'merge_clusters'):
+        merged_labels = merge_similar_clusters(embeddings_array, initial_labels, merge_threshold)
     
     final_cluster_count = len(set(merged_labels))
+    if metrics is not None:
+        metrics.add('clusters', final_cluster_count)
     logger.info(f"After merging: {final_cluster_count} final clusters")
     
     return merged_labels
@@ -0,0 +1,160 @@
+# inference.py - Shared inference service batching face recognition across concurrent jobs
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from insightface.app.common import Face
+from insightface.utils import face_align
+from .config import FACE_MODEL, INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT
+from .detector import FaceAppPool
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+_STOP = object()
+
+
+class InferenceService:
+    """
+    Drop-in face_app for concurrent pipeline runs that batches recognition.
+
+    Detection (and the other per-face models such as landmarks) runs on the
+    calling thread with an instance borrowed from a FaceAppPool. The aligned
+    face crops are then queued for one recognition model (that of the first
+    pool instance; the service only ever runs the pool's detection side
+    itself), which a background thread runs on batches of up to
+    max_batch_size crops. While other
+    callers are active a batch waits up to max_wait seconds for their crops;
+    a lone caller's crops are sent at once, so a single job doesn't pay for
+    batching while concurrent jobs share model calls.
+
+    Use it wherever a face_app is expected: run_pipeline(..., face_app=service).
+    """
+
+    def __init__(self, pool=None, model_name=FACE_MODEL, max_batch_size=INFERENCE_MAX_BATCH,
+                 max_wait=INFERENCE_MAX_WAIT):
+        self.pool = pool or FaceAppPool(model_name=model_name)
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.stats = {'batches': 0, 'faces': 0, 'largest_batch': 0}
+        self._recognizer = None
+        self._single_crop_only = False
+        self._queue = queue.Queue()
+        self._active = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._batch_loop, name='face-grouper-inference', daemon=True)
+        self._thread.start()
+
+    def warm_up(self, count=1):
+        """Load the recognition model and up to count detection instances now."""
+        self._get_recognizer()
+        self.pool.warm_up(count)
+
+    def _get_recognizer(self):
+        with self._lock:
+            if self._recognizer is None:
+                with self.pool.borrow() as app:
+                    self._recognizer = app.models['recognition']
+            return self._recognizer
+
+    def get(self, image):
+        """Detect the faces in image and fill in their embeddings, like FaceAnalysis.get."""
+        recognizer = self._get_recognizer()
+        with self._lock:
+            self._active += 1
+        try:
+            return self._detect_and_recognize(image, recognizer)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _detect_and_recognize(self, image, recognizer):
+        with self.pool.borrow() as app:
+            bboxes, kpss = app.det_model.detect(image, max_num=0, metric='default')
+            faces = []
+            for i in range(bboxes.shape[0]):
+                face = Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+                for taskname, model in app.models.items():
+                    if taskname not in ('detection', 'recognition'):
+                        model.get(image, face)
+                faces.append(face)
+        if not faces:
+            return faces
+
+        # All crops of one image travel together so they always share a batch
+        size = recognizer.input_size[0]
+        crops = [face_align.norm_crop(image, landmark=face.kps, image_size=size) for face in faces]
+        future = Future()
+        self._queue.put((crops, future))
+        for face, embedding in zip(faces, future.result()):
+            face.embedding = embedding
+        return faces
+
+    def _batch_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            batch_size = len(item[0])
+            deadline = time.perf_counter() + self.max_wait
+            stop = False
+            while batch_size < self.max_batch_size:
+                try:
+                    # Take whatever is already queued; only wait while other callers may still add crops
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0 or self._active <= 1:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+                batch_size += len(item[0])
+            self._run_batch(batch)
+            if stop:
+                return
+
+    def _recognize(self, crops):
+        if self._single_crop_only:
+            return [self._recognizer.get_feat(crop)[0] for crop in crops]
+        try:
+            return list(self._recognizer.get_feat(crops))
+        except Exception:
+            if len(crops) == 1:
+                raise
+            # Some exported models have a fixed batch size of 1
+            embeddings = [self._recognizer.get_feat(crop)[0] for crop in crops]
+            logger.warning("Recognition model rejected a batch; running it one face at a time")
+            self._single_crop_only = True
+            return embeddings
+
+    def _run_batch(self, batch):
+        crops = [crop for crops, _ in batch for crop in crops]
+        try:
+            embeddings = self._recognize(crops)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        start = 0
+        for item_crops, future in batch:
+            future.set_result([e.flatten() for e in embeddings[start:start + len(item_crops)]])
+            start += len(item_crops)
+        self.stats['batches'] += 1
+        self.stats['faces'] += len(crops)
+        self.stats['largest_batch'] = max(self.stats['largest_batch'], len(crops))
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self.stats['batches']:
+            logger.info(f"Recognized {self.stats['faces']} faces in {self.stats['batches']} batches "
+                        f"(mean {self.stats['faces'] / self.stats['batches']:.1f}, "
+                        f"largest {self.stats['largest_batch']})")
@@ -0,0 +1,153 @@
+# jobs.py - Background execution of pipeline runs with progress and cancellation
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .config import MAX_CONCURRENT_JOBS
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised at a cancellation checkpoint once a job has been cancelled."""
+
+
+def check_cancelled(should_cancel):
+    """Cancellation checkpoint: raise JobCancelled if should_cancel() says so."""
+    if should_cancel is not None and should_cancel():
+        raise JobCancelled()
+
+
+class Job:
+    """State of one submitted job; updated by the worker, read by pollers."""
+
+    def __init__(self, job_id, name):
+        self.id = job_id
+        self.name = name
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = 'Waiting for a free worker...'
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.finished = None
+        self._cancel_event = threading.Event()
+
+    def update(self, progress=None, message=None):
+        """Report progress (0-1) and/or a status message from inside the job."""
+        if progress is not None:
+            self.progress = progress
+        if message is not None:
+            self.message = message
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def snapshot(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'error': self.error,
+            'created': self.created,
+            'finished': self.finished,
+        }
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded worker pool and keeps their status in memory.
+
+    At most max_workers jobs run at once; further submissions wait in the
+    queue. Jobs receive their Job object and should pass job.is_cancelled
+    down as should_cancel so they stop at the next checkpoint.
+    """
+
+    def __init__(self, max_workers=MAX_CONCURRENT_JOBS, keep_finished=100):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='face-grouper-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._keep_finished = keep_finished
+
+    def submit(self, fn, *args, name='job', **kwargs):
+        """
+        Queue fn(job, *args, **kwargs) for background execution.
+
+        Returns:
+            The new job id
+        """
+        job = Job(uuid.uuid4().hex, name)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def _run(self, job, fn, args, kwargs):
+        if job.is_cancelled():
+            self._finish(job, CANCELLED, 'Cancelled before it started')
+            return
+        job.status = RUNNING
+        job.message = 'Starting...'
+        try:
+            job.result = fn(job, *args, **kwargs)
+            self._finish(job, DONE, 'Complete')
+        except JobCancelled:
+            self._finish(job, CANCELLED, 'Cancelled')
+        except Exception as e:
+            logger.exception(f"Job {job.id} ({job.name}) failed")
+            job.error = str(e)
+            self._finish(job, FAILED, 'Failed')
+
+    def _finish(self, job, status, message):
+        job.status = status
+        job.message = message
+        job.finished = time.time()
+        if status == DONE:
+            job.progress = 1.0
+        logger.info(f"Job {job.id} ({job.name}) {status}")
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond keep_finished."""
+        finished = [j for j in self._jobs.values() if j.status in FINISHED_STATES]
+        finished.sort(key=lambda j: j.finished)
+        for job in finished[:max(0, len(finished) - self._keep_finished)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id):
+        """Status snapshot of a job, or None if it is unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.snapshot() if job else None
+
+    def result(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.result if job else None
+
+    def cancel(self, job_id):
+        """Request cancellation; the job stops at its next checkpoint."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return False
+        job._cancel_event.set()
+        job.message = 'Cancelling...'
+        return True
+
+    def active_count(self):
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j.status not in FINISHED_STATES)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job._cancel_event.set()
+        self._executor.shutdown(wait=wait)
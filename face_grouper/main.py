@@ -1,49 +1,433 @@
 import os
-import cv2
-from .config import IMAGE_EXTENSIONS
-from .detector import detect_faces, extract_face_embedding
+import time
+import shutil
+import numpy as np
+from contextlib import contextmanager, nullcontext
+from .detector import create_face_app, detect_faces, extract_face_embedding
 from .grouper import cluster_faces
-from .organizer import organize_photos, handle_no_faces
+from .organizer import organize_photos, handle_no_faces, group_photos
+from .artifacts import CachedDetections, StageCache, canonical_labels, canonical_order, fingerprint
+from .autotune import autotune, calibration_sample
+from .checkpoint import PipelineCheckpoint, sources_digest, unpack_detections
+from .config import DECODE_WORKERS, FACE_MODEL
+from .crops import CropStore
+from .discovery import DiscoveryStream, scan_images
+from .gallery import export_gallery
+from .jobs import check_cancelled
+from .metrics import RunMetrics, measure
+from .progressive import ProgressiveBatches
+from .profiling import PipelineProfiler, resolve_profile_dir
+from .shared_frames import SharedFrameDecoder
+from .sources import ScannedPath, read_image, source_key
+from .video import detect_video, is_video
+from .logger import get_logger
+from .results import new_run_id, results_index_path, write_results_index
 
+logger = get_logger(__name__)
 
-def load_images(folder):
-    paths = []
-    for root, _, files in os.walk(folder):
-        for f in files:
-            if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS:
-                paths.append(os.path.join(root, f))
-    return paths
+RUN_REPORT = 'run_report.json'
+CHECKPOINT_DIR = '.checkpoint'
+STAGE_CACHE_DIR = '.stage_cache'
+PREVIEW_DIR = '.preview'
 
-def process_images(source_folder, update_progress=None):
+
+def load_images(folder, include=None, exclude=None, max_depth=None):
+    return [ScannedPath(*entry) for entry in scan_images(folder, include, exclude, max_depth)]
+
+def detect_image(path, face_app=None, metrics=None, profiler=None, image=None, crop_store=None):
+    """
+    Decode one image (unless already decoded, see shared_frames.py) and detect its faces.
+    With a crop_store the aligned faces are saved to it (see crops.py).
+
+    Returns:
+        List of faces, or None if the image can't be decoded
+    """
+    image_start = time.perf_counter()
+    if image is None:
+        with measure(metrics, 'decode'):
+            image = read_image(path)
+    if image is None:
+        if metrics is not None:
+            metrics.add('unreadable_images')
+        return None
+
+    with measure(metrics, 'inference'):
+        faces = detect_faces(image, face_app)
+    if crop_store is not None:
+        with measure(metrics, 'crop_store'):
+            crop_store.add(path, [(image, face) for face in faces])
+    if metrics is not None:
+        metrics.add('images')
+        metrics.add('faces', len(faces))
+        metrics.add('no_face_images', 0 if faces else 1)
+    if profiler is not None:
+        profiler.record_image(path, time.perf_counter() - image_start)
+    return faces
+
+def detect_source(path, face_app=None, metrics=None, profiler=None, image=None, crop_store=None):
+    """
+    Detect the faces in an image, or the face tracks in a video (see video.py).
+
+    Returns:
+        List of (source, face) tuples, or None if the file can't be decoded.
+        For images the source is path itself; for videos it is the frame
+        each track is represented by.
+    """
+    if is_video(path):
+        return detect_video(path, face_app, metrics, crop_store)
+    faces = detect_image(path, face_app, metrics, profiler, image, crop_store)
+    if faces is None:
+        return None
+    return [(path, face) for face in faces]
+
+def process_images(source_folder, update_progress=None, should_cancel=None, sources=None, face_app=None,
+                   metrics=None, profiler=None, checkpoint=None, resumed=None, update_count=None, decoder=None,
+                   crop_store=None):
     embeddings, photo_data = [], []
     no_faces = []  # 🆕 List to track images with no faces
+    resumed = resumed or {}
+    # Evaluated once: an empty resume mapping means every source is detected afresh
+    any_resumed = bool(resumed)
+
+    # In-memory sources (e.g. uploads) are decoded directly, without a disk round trip.
+    # Sources may also be a stream (e.g. DiscoveryStream, GDriveDownloadStream) that
+    # yields images as they arrive and reports the expected count through its total
+    # attribute once known; until then progress is reported as a count via update_count.
+    image_paths = sources if sources is not None else DiscoveryStream(source_folder)
 
-    image_paths = load_images(source_folder)
-    total = len(image_paths)
+    # With a SharedFrameDecoder, image files are decoded ahead in worker processes;
+    # everything else (uploads, videos, resumed images) is handled here as before
+    if decoder is not None:
+        local = lambda p: not isinstance(p, str) or is_video(p) or source_key(p) in resumed
+        frames = _timed(decoder.imap(image_paths, local), metrics, 'decode_wait')
+    else:
+        frames = ((path, None) for path in image_paths)
 
-    for idx, path in enumerate(image_paths):
-        image = cv2.imread(path)
-        if image is None:
+    for idx, (path, image) in enumerate(frames):
+        check_cancelled(should_cancel)
+        key = source_key(path) if any_resumed else None
+        detections, restored = None, False
+        if key in resumed:
+            # Already processed before the run was interrupted; map the records back onto the live source
+            detections = unpack_detections(path, resumed[key])
+            restored = resumed[key] is None or detections is not None
+            if restored and metrics is not None:
+                metrics.add('resumed_images')
+        if not restored:
+            detections = detect_source(path, face_app, metrics, profiler, image, crop_store)
+            if checkpoint is not None:
+                checkpoint.add(path, detections)
+        if detections is None:
             continue
 
-        faces = detect_faces(image)
-        if not faces:  # 🆕 No faces detected
+        if not detections:  # 🆕 No faces detected
             no_faces.append(path)
-        for face in faces:
+        for source, face in detections:
             emb = extract_face_embedding(face)
             embeddings.append(emb)
-            photo_data.append((path, face))
+            photo_data.append((source, face))
 
-        if update_progress:
+        total = len(image_paths) if hasattr(image_paths, '__len__') else getattr(image_paths, 'total', None)
+        if update_progress and total:
             update_progress((idx + 1) / total)
+        elif update_count and total is None:
+            update_count(idx + 1)
 
     return embeddings, photo_data, no_faces  # 🆕 return extra
 
 
-def run_pipeline(source_folder, output_folder, update_progress=None):
-    embeddings, photo_data, no_faces = process_images(source_folder, update_progress)
-    labels = cluster_faces(embeddings)
-    clusters = organize_photos(photo_data, labels, output_folder)
-    handle_no_faces(no_faces, output_folder)  # 🆕 Add this line
-    return clusters
+def _detector_id(face_app):
+    """Identifies the detection model for the stage cache: its model name, or the class of a custom face_app."""
+    if face_app is None:
+        return FACE_MODEL
+    return getattr(face_app, 'model_name', None) or type(face_app).__name__
+
+
+def _timed(items, metrics, name):
+    """Yield from items, timing each wait for the next item as stage name."""
+    items = iter(items)
+    while True:
+        with measure(metrics, name):
+            item = next(items, None)
+        if item is None:
+            return
+        yield item
+
+
+def _detect_progressively(batches, detect, preview_folder, run_id, update_progress, update_count, update_preview,
+                          should_cancel, placement_workers, metrics, cluster_params, thumbnail_size, preview_size):
+    """
+    Run detect(batch, update_count) over each of batches (a ProgressiveBatches),
+    clustering and organizing everything found so far into preview_folder
+    after every batch but the last, which run_pipeline organizes into the
+    real output as usual. The output itself is therefore never reduced to
+    the sample, also not when the run is cancelled after a preview.
+    No previews are made while every source so far was resumed from the
+    checkpoint or the stage cache.
+
+    Batches are timed as 'detect' and the provisional results as 'preview'
+    (metrics only; the profiler would overwrite its per-stage output).
+
+    Returns:
+        (embeddings, photo_data, no_faces) of all batches, as process_images
+    """
+    embeddings, photo_data, no_faces = [], [], []
+    processed = 0
+
+    def count(n):
+        total = batches.total
+        if update_progress and total:
+            update_progress((processed + n) / total)
+        elif update_count:
+            update_count(processed + n)
+
+    for batch in batches:
+        # Batches are consumed as iterators so progress is reported against the whole run
+        with measure(metrics, 'detect'):
+            batch_embeddings, batch_photo_data, batch_no_faces = detect(iter(batch), count)
+        processed = batches.done
+        embeddings.extend(batch_embeddings)
+        photo_data.extend(batch_photo_data)
+        no_faces.extend(batch_no_faces)
+        if batches.finished:
+            break
+
+        check_cancelled(should_cancel)
+        if metrics is not None and metrics.counters.get('resumed_images', 0) >= processed:
+            # Everything so far came from the checkpoint or the stage cache, so the final result is moments away
+            continue
+        with measure(metrics, 'preview'):
+            labels = cluster_faces(embeddings, **cluster_params)
+            clusters = organize_photos(photo_data, labels, preview_folder, thumbnail_size=thumbnail_size,
+                                       max_workers=placement_workers, preview_size=preview_size,
+                                       should_cancel=should_cancel)
+            handle_no_faces(no_faces, preview_folder, max_workers=placement_workers, preview_size=preview_size,
+                            should_cancel=should_cancel)
+            write_results_index(preview_folder, run_id)
+        logger.info(f"Preview after {processed} images: {len(clusters)} people")
+        if update_preview:
+            update_preview(clusters, processed)
+    return embeddings, photo_data, no_faces
+
+
+@contextmanager
+def _stage(metrics, profiler, name):
+    """Time a pipeline stage, and profile it too when profiling is on."""
+    with metrics.stage(name):
+        if profiler is None:
+            yield
+        else:
+            with profiler.stage(name):
+                yield
+
 
+def run_pipeline(source_folder, output_folder, update_progress=None, placement_workers=None, run_id=None,
+                 should_cancel=None, sources=None, face_app=None, metrics=None, prometheus_path=None,
+                 profile_dir=None, checkpoint_dir=None, resume=False, update_count=None, decode_workers=None,
+                 auto_tune=False, crop_store_dir=None, gallery=True, progressive=False,
+                 update_preview=None, cluster_params=None, thumbnail_size=(150, 150), preview_size=400,
+                 cache=False, cache_dir=None):
+    """
+    Detect, cluster and organize faces from source_folder (or sources) into output_folder.
+
+    source_folder is scanned in the background while detection runs (see
+    discovery.py); pass a DiscoveryStream as sources to filter it with
+    include/exclude globs or a max depth. update_progress receives the
+    completed fraction once the number of images is known; before that
+    update_count, if given, receives the number of images processed so far.
+
+    decode_workers (default: config.DECODE_WORKERS) > 0 decodes image files in
+    that many worker processes, handing the pixels to detection through
+    shared memory (see shared_frames.py).
+
+    auto_tune=True picks decode_workers and the ONNX Runtime thread count
+    from a short calibration on a sample of the input, cached per machine
+    (see autotune.py); explicitly passed decode_workers or face_app win.
+    The choice is recorded in the run report under info.autotune.
+
+    crop_store_dir saves every detected face as an aligned crop into a packed
+    store there, so a recognition model can later be run over the faces
+    without decoding the photos again (see crops.py). The store is rebuilt
+    on every run, except that resume=True appends to it.
+
+    gallery=True (the default) also exports a static HTML gallery of the
+    result to output_folder/gallery (see gallery.py).
+
+    progressive=True shows provisional results early: a random sample of the
+    images (config.PROGRESSIVE_SAMPLE_FRACTION) is processed, clustered and
+    organized into the provisional folder output_folder/.preview first, then
+    the rest follows in batches that double the processed count, each
+    followed by reclustering and an incremental reorganization of that
+    folder (see progressive.py). output_folder is only touched by the final
+    organize, and the provisional folder is removed when the run ends.
+    update_preview, if given, receives the provisional clusters and the
+    number of images processed after each of these intermediate steps.
+
+    cluster_params are passed on to cluster_faces (eps, min_samples,
+    merge_threshold); thumbnail_size and preview_size to organize_photos.
+
+    cache=True (or cache_dir, default output_folder/.stage_cache) keeps the
+    output of every stage as an artifact fingerprinted by its inputs and
+    parameters (see artifacts.py), so a rerun only recomputes what changed:
+    detection is skipped for files whose size and mtime are unchanged (for
+    the same model), clustering if the faces and cluster_params are the
+    same, and organizing if clusters, sources and output options are.
+    Changing only eps therefore reruns clustering and organizing, and
+    changing only thumbnail_size reruns just organizing. Cached detections
+    aren't used while a crop store is being written, as it needs every face.
+
+    Per-stage timings and throughput are collected in metrics (a RunMetrics,
+    created if not given) and written to output_folder/run_report.json, and
+    additionally in Prometheus text format to prometheus_path if set.
+
+    Profiling (cProfile per stage, tracemalloc top allocators at stage
+    boundaries and a per-image latency histogram) is enabled by profile_dir
+    or the FACE_GROUPER_PROFILE environment variable; see profiling.py.
+
+    With checkpoint_dir set (or resume=True, which defaults it to
+    output_folder/.checkpoint) detection results are checkpointed as the run
+    goes. resume=True continues from an existing checkpoint: processed images
+    are skipped, and clustering/organizing are skipped too if they finished
+    for the same set of faces.
+    """
+    run_id = run_id or new_run_id()
+    metrics = metrics or RunMetrics(run_id)
+    profile_dir = resolve_profile_dir(profile_dir, output_folder, run_id)
+    profiler = PipelineProfiler(profile_dir) if profile_dir else None
+
+    checkpoint, resumed = None, None
+    if checkpoint_dir or resume:
+        checkpoint = PipelineCheckpoint(checkpoint_dir or os.path.join(output_folder, CHECKPOINT_DIR))
+        if resume:
+            resumed = checkpoint.load_records()
+        else:
+            checkpoint.clear()
+
+    if auto_tune:
+        with _stage(metrics, profiler, 'autotune'):
+            tuning = autotune(calibration_sample(source_folder, sources))
+        if tuning is None:
+            logger.info("Not auto-tuning: nothing cached for this machine and no image sample to calibrate on")
+        else:
+            metrics.set_info('autotune', tuning)
+            if decode_workers is None:
+                decode_workers = tuning['settings']['decode_workers']
+            if face_app is None:
+                face_app = create_face_app(intra_op_threads=tuning['settings']['intra_op_threads'])
+
+    decode_workers = DECODE_WORKERS if decode_workers is None else decode_workers
+    metrics.set_info('decode_workers', decode_workers)
+
+    crop_store = None
+    if crop_store_dir:
+        crop_store = CropStore(crop_store_dir)
+        if not resume:
+            crop_store.clear()
+
+    stage_cache, detector_key = None, None
+    cluster_params = dict(cluster_params or {})
+    if cache or cache_dir:
+        stage_cache = StageCache(cache_dir or os.path.join(output_folder, STAGE_CACHE_DIR))
+        detector_key = fingerprint('detect', _detector_id(face_app))
+        if crop_store is None:
+            resumed = CachedDetections(stage_cache.load_detections(detector_key), extra=resumed)
+
+    # Provisional results of a progressive run, kept apart from the output until the final organize
+    preview_folder = os.path.join(output_folder, PREVIEW_DIR)
+    shutil.rmtree(preview_folder, ignore_errors=True)
+    try:
+        try:
+            with SharedFrameDecoder(decode_workers) if decode_workers > 0 else nullcontext() as decoder:
+                if progressive:
+                    batches = ProgressiveBatches(sources if sources is not None else load_images(source_folder))
+                    detect = lambda batch, count: process_images(None, None, should_cancel, batch, face_app, metrics,
+                                                                 profiler, checkpoint, resumed, count, decoder,
+                                                                 crop_store)
+                    embeddings, photo_data, no_faces = _detect_progressively(
+                        batches, detect, preview_folder, run_id, update_progress, update_count, update_preview,
+                        should_cancel, placement_workers, metrics, cluster_params, thumbnail_size, preview_size)
+                else:
+                    with _stage(metrics, profiler, 'detect'):
+                        embeddings, photo_data, no_faces = process_images(source_folder, update_progress,
+                                                                          should_cancel, sources, face_app, metrics,
+                                                                          profiler, checkpoint, resumed,
+                                                                          update_count, decoder, crop_store)
+        finally:
+            # Keep whatever was processed, also when the run fails or is cancelled
+            if checkpoint is not None:
+                checkpoint.flush()
+            if crop_store is not None:
+                crop_store.close()
+        check_cancelled(should_cancel)
+        if stage_cache is not None:
+            with measure(metrics, 'stage_cache'):
+                records = stage_cache.save_detections(detector_key, photo_data, no_faces)
+            logger.info(f"Cached detections of {len(records)} files")
+
+        labels = None
+        digest = sources_digest(source_key(path) for path, _ in photo_data) if checkpoint else None
+        cluster_result = checkpoint.stage_result('cluster') if resume else None
+        if cluster_result is not None and cluster_result['digest'] == digest:
+            logger.info("Resuming with clustering results from the checkpoint")
+            labels = cluster_result['labels']
+
+        # The stage cache works in canonical order; cached labels are mapped back to this run's order
+        order, cluster_key = None, None
+        if stage_cache is not None:
+            order = canonical_order(photo_data)
+            cluster_key = fingerprint('cluster', np.asarray(embeddings, dtype=np.float32)[order], cluster_params)
+        if labels is None and stage_cache is not None:
+            cached = stage_cache.load('cluster', cluster_key)
+            if cached is not None:
+                logger.info("Faces and clustering parameters unchanged, reusing the cached clusters")
+                labels = np.empty(len(order), dtype=int)
+                labels[order] = cached
+        if labels is None:
+            with _stage(metrics, profiler, 'cluster'):
+                labels = cluster_faces(embeddings, metrics=metrics, **cluster_params)
+            if checkpoint is not None:
+                checkpoint.clear_stage('organize')
+                checkpoint.mark_stage('cluster', {'digest': digest, 'labels': labels})
+            if stage_cache is not None:
+                stage_cache.save('cluster', cluster_key, np.asarray(labels, dtype=int)[order])
+
+        organize_key = None
+        if stage_cache is not None:
+            organize_key = fingerprint('organize', canonical_labels(labels, order),
+                                       [source_key(photo_data[i][0]) for i in order],
+                                       sorted(source_key(path) for path in no_faces), list(thumbnail_size),
+                                       preview_size, gallery)
+        organize_result = checkpoint.stage_result('organize') if resume else None
+        if organize_result is not None and organize_result['digest'] == digest:
+            logger.info("Output was already organized for this checkpoint, skipping")
+            clusters = group_photos(photo_data, labels)
+        elif (stage_cache is not None and os.path.exists(results_index_path(output_folder))
+              and stage_cache.load('organize', organize_key) is not None):
+            logger.info("Clusters and output options unchanged, keeping the organized output")
+            clusters = group_photos(photo_data, labels)
+        else:
+            with _stage(metrics, profiler, 'organize'):
+                clusters = organize_photos(photo_data, labels, output_folder, thumbnail_size=thumbnail_size,
+                                           max_workers=placement_workers, preview_size=preview_size,
+                                           should_cancel=should_cancel, metrics=metrics)
+                handle_no_faces(no_faces, output_folder, max_workers=placement_workers, preview_size=preview_size,
+                                should_cancel=should_cancel, metrics=metrics)  # 🆕 Add this line
+                results_index = write_results_index(output_folder, run_id)
+                if gallery:
+                    with measure(metrics, 'gallery'):
+                        export_gallery(output_folder, results_index, preview_size=preview_size,
+                                       thumbnail_size=thumbnail_size)
+            if checkpoint is not None:
+                checkpoint.mark_stage('organize', {'digest': digest})
+            if stage_cache is not None:
+                stage_cache.save('organize', organize_key, {'run_id': run_id})
+    finally:
+        shutil.rmtree(preview_folder, ignore_errors=True)
+        if profiler is not None:
+            profiler.finish()
+
+    metrics.log_summary()
+    metrics.write_json(os.path.join(output_folder, RUN_REPORT))
+    if prometheus_path:
+        metrics.write_prometheus(prometheus_path)
+    return clusters
@@ -0,0 +1,139 @@
+# metrics.py - Per-stage timing and throughput instrumentation for pipeline runs
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process in bytes, or None if unavailable."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RunMetrics:
+    """
+    Collects wall/CPU time per stage and counters for one pipeline run.
+
+    Stages may be entered many times (e.g. 'decode' once per image); their
+    times and call counts accumulate. CPU time is process-wide, so stages
+    running concurrently with other threads include those threads' work.
+    """
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.info = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            with self._lock:
+                entry = self.stages.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'calls': 0})
+                entry['wall_seconds'] += wall
+                entry['cpu_seconds'] += cpu
+                entry['calls'] += 1
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_info(self, name, value):
+        """Record a non-numeric fact about the run (parameters, settings)."""
+        self.info[name] = value
+
+    def _rate(self, counter, stage):
+        seconds = self.stages.get(stage, {}).get('wall_seconds', 0.0)
+        return self.counters.get(counter, 0) / seconds if seconds > 0 else 0.0
+
+    def report(self):
+        """The run report as a JSON-serialisable dict."""
+        return {
+            'run_id': self.run_id,
+            'started': self.started,
+            'wall_seconds': time.time() - self.started,
+            'stages': self.stages,
+            'counters': self.counters,
+            'throughput': {
+                'images_per_second': self._rate('images', 'detect'),
+                'faces_per_second': self._rate('faces', 'detect'),
+                'bytes_copied_per_second': self._rate('bytes_copied', 'organize'),
+            },
+            'peak_rss_bytes': peak_rss_bytes(),
+            'info': self.info,
+        }
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.report(), indent=2))
+
+    def write_prometheus(self, path, prefix='face_grouper'):
+        """Write the report in the Prometheus text format (for a node_exporter textfile collector)."""
+        report = self.report()
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+        metric('stage_wall_seconds', 'Wall-clock time spent per pipeline stage',
+               [({'stage': s}, v['wall_seconds']) for s, v in report['stages'].items()])
+        metric('stage_cpu_seconds', 'Process CPU time spent per pipeline stage',
+               [({'stage': s}, v['cpu_seconds']) for s, v in report['stages'].items()])
+        metric('count', 'Items processed in the last run',
+               [({'item': k}, v) for k, v in report['counters'].items()])
+        metric('throughput', 'Items per second in the last run',
+               [({'item': k}, v) for k, v in report['throughput'].items()])
+        metric('run_wall_seconds', 'Wall-clock time of the last run', [({}, report['wall_seconds'])])
+        if report['peak_rss_bytes'] is not None:
+            metric('peak_rss_bytes', 'Peak resident memory of the process', [({}, report['peak_rss_bytes'])])
+        _write_atomic(path, '\n'.join(lines) + '\n')
+
+    def log_summary(self):
+        report = self.report()
+        stages = ', '.join(f"{name} {v['wall_seconds']:.2f}s" for name, v in report['stages'].items())
+        logger.info(
+            f"Run {self.run_id}: {stages}; {report['throughput']['images_per_second']:.1f} images/s, "
+            f"{report['throughput']['faces_per_second']:.1f} faces/s"
+        )
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def measure(metrics, name):
+    """metrics.stage(name) when metrics is given, otherwise a no-op."""
+    if metrics is None:
+        yield
+    else:
+        with metrics.stage(name):
+            yield
@@ -1,23 +1,44 @@
 # organizer.py - Simple crop-and-resize approach (no padding)
 import os
-import shutil
 import cv2
 import numpy as np
 from collections import defaultdict
 from .logger import get_logger
+from .metrics import measure
 from .detector import crop_face, calculate_face_quality_score
+from .previews import sync_previews
+from .search import write_search_index
+from .atlas import atlas_index_path, build_thumbnail_atlas, load_atlas_index
+from .sources import read_image, source_exists, source_name
+from .sync import assign_group_folders, load_manifest, output_name, sync_output
 
 logger = get_logger(__name__)
 
-def handle_no_faces(no_face_paths, output_folder):
+def handle_no_faces(no_face_paths, output_folder, max_workers=None, preview_size=400, should_cancel=None,
+                    metrics=None):
     """Handle images where no faces were detected."""
-    no_face_dir = os.path.join(output_folder, "no_faces_found")
-    os.makedirs(no_face_dir, exist_ok=True)
+    with measure(metrics, 'place_files'):
+        stats = sync_output(
+            output_folder,
+            {"no_faces_found": _desired_files(no_face_paths)},
+            is_managed=lambda folder: folder == "no_faces_found",
+            max_workers=max_workers,
+            should_cancel=should_cancel,
+        )
+    _record_sync(metrics, stats)
+    with measure(metrics, 'previews'):
+        sync_previews(output_folder, preview_size, max_workers)
+    return stats
 
-    for i, path in enumerate(no_face_paths):
-        filename = os.path.basename(path)
-        dst = os.path.join(no_face_dir, f"{i}_{filename}")
-        shutil.copy2(path, dst)
+def _record_sync(metrics, stats):
+    """Add the file counts of one sync_output call to the run metrics."""
+    if metrics is None:
+        return
+    metrics.add('files_copied', stats['placement']['files'])
+    metrics.add('bytes_copied', stats['placement']['bytes'])
+    metrics.add('files_moved', stats['moved'])
+    metrics.add('files_deleted', stats['deleted'])
+    metrics.add('files_kept', stats['kept'])
 
 def create_fallback_thumbnail(items, group_folder, thumbnail_size=(150, 150)):
     """
@@ -35,7 +56,7 @@ def create_fallback_thumbnail(items, group_folder, thumbnail_size=(150, 150)):
     
     for img_path, face in items:
         try:
-            image = cv2.imread(img_path)
+            image = read_image(img_path)
             if image is None:
                 continue
                 
@@ -44,7 +65,7 @@ def create_fallback_thumbnail(items, group_folder, thumbnail_size=(150, 150)):
             
             if cropped_face is not None and cropped_face.size > 0:
                 cv2.imwrite(thumb_path, cropped_face)
-                logger.info(f"Created fallback thumbnail ({thumbnail_size[0]}x{thumbnail_size[1]}) for group from {os.path.basename(img_path)}")
+                logger.info(f"Created fallback thumbnail ({thumbnail_size[0]}x{thumbnail_size[1]}) for group from {source_name(img_path)}")
                 return True
                 
         except Exception as e:
@@ -75,7 +96,7 @@ def select_best_thumbnail(items, group_folder, thumbnail_size=(150, 150)):
     # Evaluate all faces in the group
     for img_path, face in items:
         try:
-            image = cv2.imread(img_path)
+            image = read_image(img_path)
             if image is None or not hasattr(face, "bbox"):
                 continue
             
@@ -99,7 +120,7 @@ def select_best_thumbnail(items, group_folder, thumbnail_size=(150, 150)):
     if best_crop is not None:
         try:
             cv2.imwrite(thumb_path, best_crop)
-            logger.info(f"Created quality-based thumbnail ({thumbnail_size[0]}x{thumbnail_size[1]}) for group from {os.path.basename(best_image_info)} (score: {best_score:.3f})")
+            logger.info(f"Created quality-based thumbnail ({thumbnail_size[0]}x{thumbnail_size[1]}) for group from {source_name(best_image_info)} (score: {best_score:.3f})")
             return True
         except Exception as e:
             logger.error(f"Failed to save thumbnail: {e}")
@@ -155,78 +176,150 @@ def create_placeholder_thumbnail(group_folder, thumbnail_size=(150, 150)):
         logger.error(f"Failed to create placeholder thumbnail: {e}")
         return False
 
-def organize_photos(photo_data, labels, output_dir, thumbnail_size=(150, 150)):
+def create_group_thumbnail(folder, items, group_folder, thumbnail_size=(150, 150)):
+    """
+    Create the thumbnail for one group using the 3-tier system and verify it.
+
+    Args:
+        folder: Group folder name (for logging)
+        items: List of (img_path, face) tuples
+        group_folder: Path the thumbnail is written into
+        thumbnail_size: Size of thumbnail as (width, height) - default (150, 150)
+    """
+    # GUARANTEED THUMBNAIL CREATION (3-tier system)
+    thumbnail_created = False
+    width, height = thumbnail_size
+    
+    # Tier 1: Quality-based thumbnail selection
+    logger.info(f"Creating thumbnail for {folder} using quality-based selection...")
+    thumbnail_created = select_best_thumbnail(items, group_folder, thumbnail_size)
+    
+    # Tier 2: Simple fallback if quality selection fails
+    if not thumbnail_created:
+        logger.warning(f"Quality-based thumbnail selection failed for {folder}, trying fallback...")
+        thumbnail_created = create_fallback_thumbnail(items, group_folder, thumbnail_size)
+    
+    # Tier 3: Placeholder as absolute last resort
+    if not thumbnail_created:
+        logger.warning(f"All thumbnail creation methods failed for {folder}, creating placeholder...")
+        thumbnail_created = create_placeholder_thumbnail(group_folder, thumbnail_size)
+    
+    # Final verification
+    if thumbnail_created:
+        thumb_path = os.path.join(group_folder, 'thumbnail.jpg')
+        if os.path.exists(thumb_path):
+            # Verify thumbnail has correct dimensions
+            thumb_img = cv2.imread(thumb_path)
+            if thumb_img is not None:
+                actual_h, actual_w = thumb_img.shape[:2]
+                if actual_h == height and actual_w == width:
+                    logger.info(f"âœ… Verified thumbnail for {folder}: {width}x{height}")
+                else:
+                    logger.warning(f"âš ï¸  Thumbnail size mismatch for {folder}: {actual_w}x{actual_h} (expected {width}x{height})")
+            else:
+                logger.error(f"âŒ Thumbnail file corrupted for {folder}")
+        else:
+            logger.error(f"âŒ Thumbnail file missing for {folder}")
+    else:
+        logger.error(f"âŒ CRITICAL: Failed to create any thumbnail for {folder}")
+
+def _desired_files(sources):
+    """Map stable output names to the sources that still exist."""
+    desired = {}
+    for source in sources:
+        if not source_exists(source):
+            logger.warning(f"Failed to place image {source}: source no longer exists")
+            continue
+        desired[output_name(source)] = source
+    return desired
+
+def group_photos(photo_data, labels):
+    """
+    Group (img_path, face) tuples by cluster label.
+
+    Returns:
+        List of (label, items) tuples sorted by group size (largest first)
+    """
+    grouped = defaultdict(list)
+
+    # Group faces by cluster labels
+    for data, label in zip(photo_data, labels):
+        grouped[label].append(data)
+
+    # Sort groups by size (largest first)
+    return sorted(grouped.items(), key=lambda x: -len(x[1]))
+
+def organize_photos(photo_data, labels, output_dir, thumbnail_size=(150, 150), max_workers=None,
+                    preview_size=400, should_cancel=None, metrics=None):
     """
     Organize photos by face clusters with guaranteed consistent thumbnail generation.
     All thumbnails will be exactly thumbnail_size[0] x thumbnail_size[1] pixels.
+
+    The output directory is synchronized incrementally: groups keep the folder
+    they had on the previous run, and only added, moved or removed photos are
+    touched. Thumbnails are regenerated only for groups whose members changed,
+    and are also packed into a sprite-sheet atlas (see atlas.py). Every placed
+    photo gets a downscaled preview in .previews for the detail view, and the
+    face embeddings are saved in .search for query-by-face search.
     
     Args:
-        photo_data: List of (img_path, face) tuples
+        photo_data: List of (img_path, face) tuples; img_path may also be an
+            in-memory BufferSource, which is written out only when placed
         labels: Cluster labels for each face
         output_dir: Output directory path
         thumbnail_size: Size of thumbnails as (width, height) - default (150, 150)
+        max_workers: Number of concurrent file copies (default: config.PLACEMENT_WORKERS)
+        preview_size: Longest side of the preview images in pixels - default 400
+        should_cancel: Optional callable; when it returns True the run stops with
+            JobCancelled and the output folders are left as they were
+        metrics: Optional RunMetrics to record placement, thumbnail and preview costs in
         
     Returns:
         List of (label, items) tuples sorted by group size
     """
     os.makedirs(output_dir, exist_ok=True)
-    grouped = defaultdict(list)
+    sorted_groups = group_photos(photo_data, labels)
 
-    # Group faces by cluster labels
-    for data, label in zip(photo_data, labels):
-        grouped[label].append(data)
+    folders = assign_group_folders(
+        [[img_path for img_path, _ in items] for _, items in sorted_groups],
+        load_manifest(output_dir),
+    )
+    group_items = {}
+    layout = {}
+    for folder, (label, items) in zip(folders, sorted_groups):
+        group_items[folder] = items
+        layout[folder] = _desired_files(img_path for img_path, _ in items)
 
-    # Sort groups by size (largest first)
-    sorted_groups = sorted(grouped.items(), key=lambda x: -len(x[1]))
-
-    for i, (label, items) in enumerate(sorted_groups):
-        group_folder = os.path.join(output_dir, f'person_{i+1}')
-        os.makedirs(group_folder, exist_ok=True)
-
-        # Copy all images to the group folder
-        for j, (img_path, face) in enumerate(items):
-            try:
-                filename = os.path.basename(img_path)
-                dst = os.path.join(group_folder, f'{j}_{filename}')
-                shutil.copy2(img_path, dst)
-            except Exception as e:
-                logger.warning(f"Failed to copy image {img_path}: {e}")
-
-        # GUARANTEED THUMBNAIL CREATION (3-tier system)
-        thumbnail_created = False
-        width, height = thumbnail_size
-        
-        # Tier 1: Quality-based thumbnail selection
-        logger.info(f"Creating thumbnail for person_{i+1} using quality-based selection...")
-        thumbnail_created = select_best_thumbnail(items, group_folder, thumbnail_size)
-        
-        # Tier 2: Simple fallback if quality selection fails
-        if not thumbnail_created:
-            logger.warning(f"Quality-based thumbnail selection failed for group {label}, trying fallback...")
-            thumbnail_created = create_fallback_thumbnail(items, group_folder, thumbnail_size)
-        
-        # Tier 3: Placeholder as absolute last resort
-        if not thumbnail_created:
-            logger.warning(f"All thumbnail creation methods failed for group {label}, creating placeholder...")
-            thumbnail_created = create_placeholder_thumbnail(group_folder, thumbnail_size)
-        
-        # Final verification
-        if thumbnail_created:
-            thumb_path = os.path.join(group_folder, 'thumbnail.jpg')
-            if os.path.exists(thumb_path):
-                # Verify thumbnail has correct dimensions
-                thumb_img = cv2.imread(thumb_path)
-                if thumb_img is not None:
-                    actual_h, actual_w = thumb_img.shape[:2]
-                    if actual_h == height and actual_w == width:
-                        logger.info(f"âœ… Verified thumbnail for person_{i+1}: {width}x{height}")
-                    else:
-                        logger.warning(f"âš ï¸  Thumbnail size mismatch for person_{i+1}: {actual_w}x{actual_h} (expected {width}x{height})")
-                else:
-                    logger.error(f"âŒ Thumbnail file corrupted for person_{i+1}")
-            else:
-                logger.error(f"âŒ Thumbnail file missing for person_{i+1}")
-        else:
-            logger.error(f"âŒ CRITICAL: Failed to create any thumbnail for group {label}")
+    # The atlas records the size the current thumbnails were made at
+    atlas = load_atlas_index(output_dir)
+    refresh_thumbnails = atlas is not None and atlas['tile_size'] != list(thumbnail_size)
+
+    def make_thumbnail(folder, staging_path):
+        with measure(metrics, 'thumbnails'):
+            create_group_thumbnail(folder, group_items[folder], staging_path, thumbnail_size)
+
+    with measure(metrics, 'place_files'):
+        stats = sync_output(
+            output_dir,
+            layout,
+            is_managed=lambda folder: folder.startswith('person_'),
+            make_thumbnail=make_thumbnail,
+            max_workers=max_workers,
+            should_cancel=should_cancel,
+            refresh_thumbnails=refresh_thumbnails,
+        )
+    _record_sync(metrics, stats)
+
+    # Pack thumbnails into sprite sheets for the overview page
+    if stats['synced'] or not os.path.exists(atlas_index_path(output_dir)):
+        with measure(metrics, 'atlas'):
+            build_thumbnail_atlas(output_dir, folders, thumbnail_size)
+
+    with measure(metrics, 'previews'):
+        sync_previews(output_dir, preview_size, max_workers)
+
+    # Embeddings per face and per group for query-by-face search (see search.py)
+    with measure(metrics, 'search_index'):
+        write_search_index(output_dir, list(group_items.items()))
 
     return sorted_groups
\ No newline at end of file
@@ -0,0 +1,110 @@
+# placement.py - Concurrent file placement for output folders
+import os
+import time
+import errno
+from concurrent.futures import ThreadPoolExecutor
+from .config import PLACEMENT_WORKERS, PLACEMENT_RETRIES, PLACEMENT_RETRY_DELAY
+from .jobs import check_cancelled
+from .logger import get_logger
+from .sources import write_source
+
+logger = get_logger(__name__)
+
+PARTIAL_SUFFIX = '.part'
+
+# Errors worth retrying on network storage (NFS/SMB hiccups, timeouts)
+TRANSIENT_ERRNOS = {
+    errno.EAGAIN, errno.EBUSY, errno.EINTR, errno.EIO,
+    errno.ETIMEDOUT, errno.ECONNRESET, errno.ESTALE,
+}
+
+
+def is_transient_error(error):
+    """Return True if an OSError looks like a temporary storage failure."""
+    return isinstance(error, (TimeoutError, ConnectionError)) or getattr(error, 'errno', None) in TRANSIENT_ERRNOS
+
+
+def copy_with_retries(src, dst, retries=PLACEMENT_RETRIES, retry_delay=PLACEMENT_RETRY_DELAY):
+    """
+    Copy one source (file path or in-memory buffer) to dst, retrying
+    transient errors with exponential backoff.
+
+    The copy is written to dst + '.part' and renamed into place, so a copy
+    that fails for good (e.g. a disk filling up mid-write) leaves no
+    truncated file at dst.
+
+    Returns:
+        Number of bytes written
+    """
+    tmp_path = dst + PARTIAL_SUFFIX
+    attempt = 0
+    while True:
+        try:
+            write_source(src, tmp_path)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, dst)
+            return size
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if attempt >= retries or not is_transient_error(e):
+                raise
+            delay = retry_delay * (2 ** attempt)
+            logger.warning(f"Transient error copying {src} ({e}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            attempt += 1
+
+
+def place_files(copies, max_workers=None, retries=None, should_cancel=None):
+    """
+    Copy (source, dst) pairs using a bounded thread pool.
+
+    Copies to network storage are latency-bound, so keeping several in flight
+    at once is much faster than copying one file after another.
+
+    Args:
+        copies: List of (source, dst) tuples; sources are paths or BufferSource
+        max_workers: Number of concurrent copies (default: config.PLACEMENT_WORKERS)
+        retries: Retries per file on transient errors (default: config.PLACEMENT_RETRIES)
+        should_cancel: Optional callable; when it returns True pending copies are
+            dropped and JobCancelled is raised
+
+    Returns:
+        Summary dict with files, bytes, failed, seconds, files_per_sec and bytes_per_sec
+    """
+    max_workers = max_workers or PLACEMENT_WORKERS
+    retries = PLACEMENT_RETRIES if retries is None else retries
+    summary = {'files': 0, 'bytes': 0, 'failed': 0, 'seconds': 0.0, 'files_per_sec': 0.0, 'bytes_per_sec': 0.0}
+    if not copies:
+        return summary
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            (src, executor.submit(copy_with_retries, src, dst, retries))
+            for src, dst in copies
+        ]
+        for src, future in futures:
+            if should_cancel is not None and should_cancel():
+                for _, pending in futures:
+                    pending.cancel()
+                check_cancelled(should_cancel)
+            try:
+                summary['bytes'] += future.result()
+                summary['files'] += 1
+            except Exception as e:
+                summary['failed'] += 1
+                logger.warning(f"Failed to copy image {src}: {e}")
+
+    elapsed = time.perf_counter() - start
+    summary['seconds'] = elapsed
+    if elapsed > 0:
+        summary['files_per_sec'] = summary['files'] / elapsed
+        summary['bytes_per_sec'] = summary['bytes'] / elapsed
+
+    logger.info(
+        f"Placed {summary['files']} files ({summary['bytes'] / 1e6:.1f} MB) in {elapsed:.2f}s "
+        f"with {max_workers} workers: {summary['files_per_sec']:.1f} files/s, "
+        f"{summary['bytes_per_sec'] / 1e6:.1f} MB/s, {summary['failed']} failed"
+    )
+    return summary
@@ -0,0 +1,114 @@
+# previews.py - Downscaled preview images for browsing large groups
+import os
+import json
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+from .config import PLACEMENT_WORKERS
+from .sync import load_manifest
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+PREVIEW_DIR = '.previews'
+PREVIEW_INDEX = 'previews.json'
+
+
+def preview_name(name):
+    """Preview file name for an output file name."""
+    return f"{name}.jpg"
+
+
+def load_preview_index(output_dir):
+    """Load {output file name: {'path', 'size'}} for the previews that exist."""
+    try:
+        with open(os.path.join(output_dir, PREVIEW_DIR, PREVIEW_INDEX), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def create_preview(src, dst, max_size=400, quality=85):
+    """
+    Write a JPEG copy of src whose longest side is at most max_size pixels.
+
+    Returns:
+        (width, height) of the preview, or None if the source can't be read
+    """
+    image = cv2.imread(src)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    scale = min(1.0, max_size / max(height, width))
+    if scale < 1.0:
+        width, height = max(1, int(width * scale)), max(1, int(height * scale))
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    cv2.imwrite(dst, image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return width, height
+
+
+def sync_previews(output_dir, max_size=400, max_workers=None):
+    """
+    Make sure every file placed by the organizer has a preview, and drop
+    previews whose file is gone. Existing previews are reused across runs.
+
+    Args:
+        output_dir: Output directory path
+        max_size: Longest preview side in pixels
+        max_workers: Number of previews generated concurrently
+
+    Returns:
+        Preview index dict of output file name -> {'path', 'size'}
+    """
+    preview_dir = os.path.join(output_dir, PREVIEW_DIR)
+    os.makedirs(preview_dir, exist_ok=True)
+
+    # Previews are made from the placed copies, which also covers in-memory sources
+    sources = {}
+    for folder, entries in load_manifest(output_dir).items():
+        for name in entries:
+            placed_path = os.path.join(output_dir, folder, name)
+            if name not in sources and os.path.exists(placed_path):
+                sources[name] = placed_path
+
+    previous = load_preview_index(output_dir)
+    index = {}
+    missing = []
+    created = 0
+    for name, source in sources.items():
+        entry = previous.get(name)
+        if entry and entry.get('max_size') == max_size and os.path.exists(os.path.join(output_dir, entry['path'])):
+            index[name] = entry
+        else:
+            missing.append((name, source))
+
+    def build(item):
+        name, source = item
+        relative_path = os.path.join(PREVIEW_DIR, preview_name(name))
+        try:
+            size = create_preview(source, os.path.join(output_dir, relative_path), max_size)
+        except Exception as e:
+            logger.warning(f"Failed to create preview for {source}: {e}")
+            size = None
+        return name, relative_path, size
+
+    with ThreadPoolExecutor(max_workers=max_workers or PLACEMENT_WORKERS) as executor:
+        for name, relative_path, size in executor.map(build, missing):
+            if size is not None:
+                index[name] = {'path': relative_path, 'size': list(size), 'max_size': max_size}
+                created += 1
+
+    # Remove previews of files that are no longer placed anywhere
+    keep = {os.path.basename(entry['path']) for entry in index.values()} | {PREVIEW_INDEX}
+    removed = 0
+    for filename in os.listdir(preview_dir):
+        if filename not in keep:
+            os.remove(os.path.join(preview_dir, filename))
+            removed += 1
+
+    tmp_path = os.path.join(preview_dir, PREVIEW_INDEX + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, os.path.join(preview_dir, PREVIEW_INDEX))
+
+    logger.info(f"Previews: {created} created, {removed} removed, {len(index)} total")
+    return index
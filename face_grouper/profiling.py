@@ -0,0 +1,137 @@
+# profiling.py - Opt-in cProfile, tracemalloc and per-image latency profiling
+import os
+import io
+import json
+import heapq
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# Set to 1/true to profile into <output>/profiles/<run id>, or to a base directory
+PROFILE_ENV = 'FACE_GROUPER_PROFILE'
+
+# Upper bounds (seconds) of the per-image latency histogram buckets
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf')]
+
+
+def resolve_profile_dir(profile_dir, output_folder, run_id):
+    """
+    Directory to write profiling artifacts to, or None when profiling is off.
+    An explicit profile_dir wins over the FACE_GROUPER_PROFILE variable.
+    """
+    if profile_dir:
+        return profile_dir
+    value = os.environ.get(PROFILE_ENV, '').strip()
+    if not value or value.lower() in ('0', 'false', 'no'):
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return os.path.join(output_folder, 'profiles', run_id)
+    return os.path.join(value, run_id)
+
+
+class PipelineProfiler:
+    """
+    Writes profiling artifacts for one run into run_dir:
+
+    - <stage>.prof / <stage>.txt: cProfile data and the top functions by cumulative time
+    - <stage>_memory.txt: top allocation sites, growth over the stage from tracemalloc
+    - image_latency.json: histogram, percentiles and the slowest images
+
+    Only the thread that enters a stage is profiled by cProfile.
+    """
+
+    def __init__(self, run_dir, sample_every=1, top_functions=50, top_allocators=25, slowest_images=20):
+        self.run_dir = run_dir
+        self.sample_every = max(1, sample_every)
+        self.top_functions = top_functions
+        self.top_allocators = top_allocators
+        self.slowest_images = slowest_images
+        self._latencies = []
+        self._slowest = []
+        self._seen = 0
+        os.makedirs(run_dir, exist_ok=True)
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        before = tracemalloc.take_snapshot()
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            after = tracemalloc.take_snapshot()
+            self._write_profile(name, profile)
+            self._write_memory(name, before, after)
+
+    def _write_profile(self, name, profile):
+        profile.dump_stats(os.path.join(self.run_dir, f'{name}.prof'))
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats('cumulative').print_stats(self.top_functions)
+        with open(os.path.join(self.run_dir, f'{name}.txt'), 'w', encoding='utf-8') as f:
+            f.write(text.getvalue())
+
+    def _write_memory(self, name, before, after):
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"Stage {name}: traced memory now {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB",
+            f"Top {self.top_allocators} allocation sites by growth during the stage:",
+        ]
+        for stat in after.compare_to(before, 'lineno')[:self.top_allocators]:
+            lines.append(str(stat))
+        lines.append(f"Top {self.top_allocators} allocation sites at the end of the stage:")
+        for stat in after.statistics('lineno')[:self.top_allocators]:
+            lines.append(str(stat))
+        with open(os.path.join(self.run_dir, f'{name}_memory.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def record_image(self, source, seconds):
+        """Record the processing latency of one image (every sample_every-th image is kept)."""
+        self._seen += 1
+        if (self._seen - 1) % self.sample_every:
+            return
+        self._latencies.append(seconds)
+        entry = (seconds, str(source))
+        if len(self._slowest) < self.slowest_images:
+            heapq.heappush(self._slowest, entry)
+        elif entry > self._slowest[0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def latency_report(self):
+        latencies = sorted(self._latencies)
+        histogram = []
+        for upper in LATENCY_BUCKETS:
+            histogram.append({
+                'le': 'inf' if upper == float('inf') else upper,
+                'count': sum(1 for s in latencies if s <= upper),
+            })
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+        return {
+            'images_seen': self._seen,
+            'images_sampled': len(latencies),
+            'sample_every': self.sample_every,
+            'mean_seconds': sum(latencies) / len(latencies) if latencies else None,
+            'percentiles': {f'p{p}': percentile(p) for p in (50, 90, 99)},
+            'histogram': histogram,
+            'slowest': [{'source': source, 'seconds': seconds} for seconds, source in sorted(self._slowest, reverse=True)],
+        }
+
+    def finish(self):
+        """Write the latency report and stop tracemalloc if this profiler started it."""
+        with open(os.path.join(self.run_dir, 'image_latency.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.latency_report(), f, indent=2)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        logger.info(f"Profiling artifacts written to {self.run_dir}")
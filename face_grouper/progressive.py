@@ -0,0 +1,100 @@
+# progressive.py - Splitting a run into a quick sample and refining batches (run_pipeline(progressive=True))
+import random
+from itertools import islice
+from .config import PROGRESSIVE_MIN_SAMPLE, PROGRESSIVE_SAMPLE_FRACTION
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ProgressiveBatches:
+    """
+    Splits the sources of a run into batches: first a sample of
+    sample_fraction of them (at least min_sample), then the rest in batches
+    that each double the number of sources handed out so far. Clustering
+    after every batch therefore costs at most about twice the final
+    clustering.
+
+    Lists are sampled at random, so the first people shown are
+    representative of the whole set; the rest keeps its original order.
+    Streams (e.g. GDriveDownloadStream) are split lazily in arrival order, so
+    downloads and detection still overlap; the sample size is taken from
+    their total once it is known.
+
+    Iterate it once; done counts the sources handed out so far and, after
+    each batch, finished tells whether it was the last.
+    """
+
+    def __init__(self, sources, sample_fraction=PROGRESSIVE_SAMPLE_FRACTION, min_sample=PROGRESSIVE_MIN_SAMPLE,
+                 seed=None):
+        self.sources = sources
+        self.sample_fraction = sample_fraction
+        self.min_sample = min_sample
+        self.seed = seed
+        self.done = 0
+        self.finished = False
+
+    @property
+    def total(self):
+        if isinstance(self.sources, (list, tuple)):
+            return len(self.sources)
+        return getattr(self.sources, 'total', None)
+
+    def _sample_size(self, total):
+        return max(self.min_sample, int(total * self.sample_fraction)) if total else self.min_sample
+
+    def __iter__(self):
+        if isinstance(self.sources, (list, tuple)):
+            yield from self._list_batches()
+        else:
+            yield from self._stream_batches()
+
+    def _list_batches(self):
+        sources = list(self.sources)
+        size = self._sample_size(len(sources))
+        if len(sources) <= 2 * size:
+            # Too few images for a preview to be worth an extra clustering pass
+            self.done = len(sources)
+            self.finished = True
+            yield sources
+            return
+
+        chosen = set(random.Random(self.seed).sample(range(len(sources)), size))
+        rest = [source for i, source in enumerate(sources) if i not in chosen]
+        batches = [[sources[i] for i in sorted(chosen)]]
+        start, planned = 0, size
+        while start < len(rest):
+            batches.append(rest[start:start + planned])
+            start += planned
+            planned *= 2
+        for number, batch in enumerate(batches):
+            self.done += len(batch)
+            self.finished = number == len(batches) - 1
+            yield batch
+
+    def _stream_batches(self):
+        items = iter(self.sources)
+        first = next(items, None)
+        if first is None:
+            self.finished = True
+            return
+        # Streams know their total once they have started yielding
+        pending = [first]
+        size = self._sample_size(self.total)
+        while not self.finished:
+            yield self._take(pending, items, size)
+            size = self.done
+
+    def _take(self, pending, items, size):
+        """Lazily yield up to size sources, counting them in done; sets finished once the stream ends."""
+        taken = 0
+        while pending and taken < size:
+            self.done += 1
+            taken += 1
+            yield pending.pop(0)
+        for source in islice(items, size - taken):
+            self.done += 1
+            taken += 1
+            yield source
+        total = self.total
+        self.finished = taken < size or (total is not None and self.done >= total)
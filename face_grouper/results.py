@@ -0,0 +1,96 @@
+# results.py - Index of the grouped output, written once per pipeline run
+import os
+import json
+import time
+import uuid
+from .sync import load_manifest, THUMBNAIL_NAME
+from .previews import load_preview_index
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+RESULTS_INDEX = 'groups_index.json'
+NO_FACES_FOLDER = 'no_faces_found'
+
+
+def results_index_path(output_dir):
+    return os.path.join(output_dir, RESULTS_INDEX)
+
+
+def new_run_id():
+    return uuid.uuid4().hex
+
+
+def _list_group_files(output_dir, folder, manifest):
+    """Files placed in a group folder, from the manifest when possible."""
+    if folder in manifest:
+        return sorted(manifest[folder])
+    return sorted(f for f in os.listdir(os.path.join(output_dir, folder)) if f != THUMBNAIL_NAME)
+
+
+def build_results_index(output_dir, run_id=None):
+    """
+    Describe every group in output_dir: file counts, file lists and thumbnails.
+
+    Uses the sync manifest written by the organizer, so no group folders need
+    to be listed; folders written by older versions are scanned instead.
+
+    Args:
+        output_dir: Output directory path
+        run_id: Identifier of the pipeline run that produced the output
+
+    Returns:
+        Index dict with run_id, created, groups (largest first), no_faces and
+        previews (output file name -> preview path and size)
+    """
+    manifest = load_manifest(output_dir)
+    folders = [
+        f for f in os.listdir(output_dir)
+        if f.startswith('person_') and os.path.isdir(os.path.join(output_dir, f))
+    ]
+
+    groups = []
+    for folder in folders:
+        files = _list_group_files(output_dir, folder, manifest)
+        thumbnail = os.path.join(folder, THUMBNAIL_NAME)
+        groups.append({
+            'folder': folder,
+            'count': len(files),
+            'files': files,
+            'thumbnail': thumbnail if os.path.exists(os.path.join(output_dir, thumbnail)) else None,
+        })
+    groups.sort(key=lambda g: (-g['count'], g['folder']))
+
+    no_faces = []
+    if os.path.isdir(os.path.join(output_dir, NO_FACES_FOLDER)):
+        no_faces = _list_group_files(output_dir, NO_FACES_FOLDER, manifest)
+
+    return {
+        'run_id': run_id or new_run_id(),
+        'created': time.time(),
+        'groups': groups,
+        'no_faces': {'folder': NO_FACES_FOLDER, 'count': len(no_faces), 'files': no_faces},
+        'previews': load_preview_index(output_dir),
+    }
+
+
+def write_results_index(output_dir, run_id=None):
+    """Build the results index and write it atomically next to the groups."""
+    index = build_results_index(output_dir, run_id)
+    tmp_path = results_index_path(output_dir) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, results_index_path(output_dir))
+    logger.info(f"Wrote results index for run {index['run_id']}: {len(index['groups'])} groups")
+    return index
+
+
+def load_results_index(output_dir):
+    """Load the results index, building it from the folders if it is missing."""
+    try:
+        with open(results_index_path(output_dir), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        if not os.path.isdir(output_dir):
+            return None
+        return build_results_index(output_dir)
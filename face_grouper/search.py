@@ -0,0 +1,219 @@
+# search.py - Query-by-face search over a grouped library
+import os
+import json
+import shutil
+import numpy as np
+from .config import SEARCH_IVF_MIN_FACES, SEARCH_NPROBE
+from .detector import detect_faces, extract_face_embedding
+from .logger import get_logger
+from .sync import output_name, THUMBNAIL_NAME
+
+logger = get_logger(__name__)
+
+SEARCH_DIR = '.search'
+SEARCH_META = 'index.json'
+EMBEDDINGS_FILE = 'embeddings.npy'
+CENTROIDS_FILE = 'centroids.npy'
+IVF_FILE = 'ivf.npz'
+# Not .sync/.old, which sync.py treats as its own leftovers
+BUILD_SUFFIX = '-new'
+PREVIOUS_SUFFIX = '-prev'
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def build_ivf(embeddings, nlist=None):
+    """
+    Partition normalized embeddings into nlist k-means cells (an inverted file).
+
+    Returns:
+        (cell centroids, face indices ordered by cell, offsets) where the faces
+        of cell i are order[offsets[i]:offsets[i + 1]]
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    nlist = nlist or int(np.sqrt(len(embeddings)))
+    # Cells are learned from a sample, which is plenty for placing the centroids
+    rng = np.random.default_rng(0)
+    sample = embeddings[rng.choice(len(embeddings), min(len(embeddings), nlist * 64), replace=False)]
+    kmeans = MiniBatchKMeans(n_clusters=nlist, random_state=0, batch_size=4096, n_init=1).fit(sample)
+    assignments = kmeans.predict(embeddings)
+    order = np.argsort(assignments, kind='stable')
+    offsets = np.searchsorted(assignments[order], np.arange(nlist + 1))
+    return _normalize(kmeans.cluster_centers_), order, offsets
+
+
+def write_search_index(output_dir, groups, ivf_min_faces=SEARCH_IVF_MIN_FACES):
+    """
+    Persist the face embeddings of the grouped library for search_image().
+
+    Stores one normalized embedding per face with the group folder and output
+    file it belongs to, plus one centroid per group. Libraries with at least
+    ivf_min_faces faces also get an IVF index for approximate search.
+    The index is built next to the live one and swapped in with a rename.
+
+    Args:
+        output_dir: Output directory path
+        groups: List of (folder, items) tuples, items being (img_path, face) tuples
+        ivf_min_faces: Face count from which the approximate index is built
+    """
+    folders = [folder for folder, _ in groups]
+    faces, embeddings, centroids = [], [], []
+    for folder_index, (folder, items) in enumerate(groups):
+        group_embeddings = _normalize([extract_face_embedding(face) for _, face in items])
+        embeddings.append(group_embeddings)
+        centroids.append(_normalize(group_embeddings.mean(axis=0)))
+        faces.extend([folder_index, output_name(img_path)] for img_path, _ in items)
+
+    search_dir = os.path.join(output_dir, SEARCH_DIR)
+    build_dir = search_dir + BUILD_SUFFIX
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+
+    embeddings = np.concatenate(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+    np.save(os.path.join(build_dir, EMBEDDINGS_FILE), embeddings)
+    np.save(os.path.join(build_dir, CENTROIDS_FILE), np.array(centroids, dtype=np.float32))
+
+    approximate = len(embeddings) >= ivf_min_faces
+    if approximate:
+        ivf_centroids, order, offsets = build_ivf(embeddings)
+        np.savez(os.path.join(build_dir, IVF_FILE), centroids=ivf_centroids, order=order, offsets=offsets)
+
+    with open(os.path.join(build_dir, SEARCH_META), 'w', encoding='utf-8') as f:
+        json.dump({'folders': folders, 'faces': faces, 'approximate': approximate}, f)
+
+    previous_dir = search_dir + PREVIOUS_SUFFIX
+    if os.path.exists(search_dir):
+        os.rename(search_dir, previous_dir)
+    os.rename(build_dir, search_dir)
+    shutil.rmtree(previous_dir, ignore_errors=True)
+    logger.info(f"Wrote {'approximate' if approximate else 'exact'} search index: "
+                f"{len(faces)} faces in {len(folders)} groups")
+
+
+class FaceSearchIndex:
+    """
+    The persisted embeddings of one output folder, loaded for repeated queries.
+
+    Embeddings are memory-mapped, so loading is cheap; queries are a single
+    matrix-vector product (exact) or one over the nprobe closest IVF cells
+    (approximate, for large libraries).
+    """
+
+    def __init__(self, output_dir, nprobe=SEARCH_NPROBE):
+        search_dir = os.path.join(output_dir, SEARCH_DIR)
+        with open(os.path.join(search_dir, SEARCH_META), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.output_dir = output_dir
+        self.folders = meta['folders']
+        self.faces = meta['faces']
+        self.nprobe = nprobe
+        self.counts = np.bincount([folder_index for folder_index, _ in self.faces], minlength=len(self.folders))
+        self.embeddings = np.load(os.path.join(search_dir, EMBEDDINGS_FILE), mmap_mode='r')
+        self.centroids = np.load(os.path.join(search_dir, CENTROIDS_FILE))
+        self.ivf = None
+        if meta['approximate']:
+            with np.load(os.path.join(search_dir, IVF_FILE)) as ivf:
+                self.ivf = {name: ivf[name] for name in ivf.files}
+
+    def _candidates(self, query):
+        """Indices of the faces to score exactly: all of them, or those in the closest IVF cells."""
+        if self.ivf is None:
+            return None
+        cells = np.argsort(-(self.ivf['centroids'] @ query))[:self.nprobe]
+        offsets, order = self.ivf['offsets'], self.ivf['order']
+        return np.concatenate([order[offsets[c]:offsets[c + 1]] for c in cells])
+
+    def search(self, embedding, top_k=10):
+        """
+        Find the people and photos closest to a face embedding.
+
+        Returns:
+            Dict with 'people' (folder, score, count, thumbnail) and 'photos'
+            (folder, file, score), each sorted by cosine similarity, best first
+        """
+        query = _normalize(embedding)
+        results = {'people': [], 'photos': []}
+        if not self.faces:
+            return results
+
+        people_scores = self.centroids @ query
+        for i in np.argsort(-people_scores)[:top_k]:
+            folder = self.folders[i]
+            results['people'].append({
+                'folder': folder,
+                'score': float(people_scores[i]),
+                'count': int(self.counts[i]),
+                'thumbnail': os.path.join(folder, THUMBNAIL_NAME),
+            })
+
+        candidates = self._candidates(query)
+        if candidates is None:
+            candidates = np.arange(len(self.faces))
+            scores = np.asarray(self.embeddings @ query)
+        else:
+            candidates = np.sort(candidates)  # sequential reads from the memory map
+            scores = np.asarray(self.embeddings[candidates] @ query)
+
+        # A photo can hold several faces of the same person; keep its best one.
+        # Only the best few faces are sorted, widening the window if duplicates use it up.
+        limit = top_k * 4
+        while True:
+            limit = min(limit, len(scores))
+            best = np.argpartition(-scores, limit - 1)[:limit]
+            best = best[np.argsort(-scores[best])]
+            seen = set()
+            photos = []
+            for i in best:
+                folder_index, name = self.faces[candidates[i]]
+                if (folder_index, name) in seen:
+                    continue
+                seen.add((folder_index, name))
+                photos.append({'folder': self.folders[folder_index], 'file': name, 'score': float(scores[i])})
+                if len(photos) == top_k:
+                    break
+            if len(photos) == top_k or limit == len(scores):
+                break
+            limit *= 4
+        results['photos'] = photos
+        return results
+
+
+def load_search_index(output_dir, nprobe=SEARCH_NPROBE):
+    """Load the search index of output_dir, or None if it has none."""
+    if not os.path.exists(os.path.join(output_dir, SEARCH_DIR, SEARCH_META)):
+        return None
+    return FaceSearchIndex(output_dir, nprobe)
+
+
+def query_embedding(image, face_app=None):
+    """Embedding of the largest face in a query image, or None if it has no face."""
+    faces = detect_faces(image, face_app)
+    if not faces:
+        return None
+    face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+    return extract_face_embedding(face)
+
+
+def search_image(index, image, top_k=10, face_app=None):
+    """
+    Find the people and photos matching the largest face in image.
+
+    Args:
+        index: FaceSearchIndex of the library (see load_search_index)
+        image: Decoded BGR query image, e.g. from sources.read_image
+        top_k: Number of people and of photos to return
+        face_app: Optional face_app or FaceAppPool to detect with
+
+    Returns:
+        Results dict as returned by FaceSearchIndex.search, or None if the
+        query image has no face
+    """
+    embedding = query_embedding(image, face_app)
+    if embedding is None:
+        return None
+    return index.search(embedding, top_k)
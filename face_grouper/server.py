@@ -0,0 +1,290 @@
+# server.py - Local HTTP API for running face grouping jobs headless
+#
+#   python -m face_grouper.server [--host 127.0.0.1] [--port 8765] [--output-root server_output]
+#
+# Endpoints (JSON in and out):
+#   GET  /health                 server status and number of active jobs
+#   POST /jobs                   submit {"folder": path, "include"/"exclude": [globs], "max_depth": n}
+#                                or {"images": [{"name": "a.jpg", "data": "<base64>"}, ...]}
+#   GET  /jobs/<id>              job status and progress
+#   GET  /jobs/<id>/groups       results index of a finished job (groups_index.json)
+#   POST /jobs/<id>/cancel       request cancellation (DELETE /jobs/<id> does the same)
+#   POST /jobs/<id>/search       find the people and photos of a finished job matching the face in
+#                                {"image": "<base64>", "top_k": 10}
+import os
+import re
+import json
+import base64
+import argparse
+import binascii
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .config import (MAX_CONCURRENT_JOBS, SERVER_HOST, SERVER_PORT, SERVER_OUTPUT_ROOT,
+                     SERVER_MAX_REQUEST_BYTES)
+from .detector import FaceAppPool
+from .inference import InferenceService
+from .discovery import DiscoveryStream
+from .jobs import JobManager, DONE
+from .logger import get_logger
+from .main import run_pipeline
+from .results import load_results_index
+from .search import load_search_index, search_image
+from .sources import BufferSource, read_image
+
+logger = get_logger(__name__)
+
+JOB_PATH = re.compile(r'^/jobs/([0-9a-f]{32})(/groups|/cancel|/search)?$')
+
+
+class BadRequest(Exception):
+    """Raised for invalid request bodies; reported to the client as 400."""
+
+
+def pipeline_job(job, output_root, face_app, source_folder=None, sources=None):
+    """Background job: run the pipeline into output_root/<job id>."""
+    def update_progress(fraction):
+        job.update(fraction, f"Processing: {int(fraction * 100)}%")
+
+    def update_count(processed):
+        job.update(message=f"Discovering images, processed {processed} so far")
+
+    clusters = run_pipeline(source_folder, job_output_dir(output_root, job.id), update_progress=update_progress,
+                            should_cancel=job.is_cancelled, sources=sources, face_app=face_app, run_id=job.id,
+                            update_count=update_count)
+    return {'groups': len(clusters)}
+
+
+def job_output_dir(output_root, job_id):
+    return os.path.join(output_root, job_id)
+
+
+def parse_submission(payload):
+    """
+    Turn a POST /jobs body into run_pipeline arguments.
+
+    Returns:
+        (source_folder, sources) tuple
+    """
+    if not isinstance(payload, dict):
+        raise BadRequest("Expected a JSON object")
+
+    if 'folder' in payload:
+        folder = payload['folder']
+        if not isinstance(folder, str) or not os.path.isdir(folder):
+            raise BadRequest(f"Not a folder: {folder!r}")
+        max_depth = payload.get('max_depth')
+        if max_depth is not None and (not isinstance(max_depth, int) or max_depth < 0):
+            raise BadRequest("max_depth must be a non-negative integer")
+        stream = DiscoveryStream(folder, include=payload.get('include'), exclude=payload.get('exclude'),
+                                 max_depth=max_depth)
+        return folder, stream
+
+    if 'images' in payload:
+        images = payload['images']
+        if not isinstance(images, list) or not images:
+            raise BadRequest("images must be a non-empty list")
+        sources = []
+        for image in images:
+            try:
+                # Only the base name is kept so uploads can't write outside the output folder
+                name = os.path.basename(str(image['name']))
+                data = base64.b64decode(image['data'], validate=True)
+            except (KeyError, TypeError, binascii.Error) as e:
+                raise BadRequest(f"Invalid image entry: {e}")
+            if not name:
+                raise BadRequest("Image names must not be empty")
+            sources.append(BufferSource(name, data))
+        return None, sources
+
+    raise BadRequest("Submit either 'folder' or 'images'")
+
+
+class FaceGroupingServer(ThreadingHTTPServer):
+    """HTTP server holding the job pool and the warm model pool shared by all requests."""
+
+    def __init__(self, address, output_root=SERVER_OUTPUT_ROOT, max_jobs=MAX_CONCURRENT_JOBS, face_app=None):
+        super().__init__(address, FaceGroupingHandler)
+        self.output_root = output_root
+        self.jobs = JobManager(max_workers=max_jobs)
+        # One detection model instance per concurrent job; recognition is batched across jobs
+        self.face_app = face_app or InferenceService(FaceAppPool(size=max_jobs))
+        self._search_indexes = {}
+        self._search_lock = threading.Lock()
+        os.makedirs(output_root, exist_ok=True)
+
+    def submit(self, source_folder, sources):
+        name = 'folder' if source_folder else 'upload'
+        return self.jobs.submit(pipeline_job, self.output_root, self.face_app, source_folder, sources, name=name)
+
+    def search_index(self, job_id):
+        """Search index of a job's output, loaded once and kept for later queries."""
+        with self._search_lock:
+            if job_id not in self._search_indexes:
+                index = load_search_index(job_output_dir(self.output_root, job_id))
+                if index is None:
+                    return None
+                self._search_indexes[job_id] = index
+            return self._search_indexes[job_id]
+
+    def server_close(self):
+        self.jobs.shutdown(wait=False)
+        if isinstance(self.face_app, InferenceService):
+            self.face_app.close()
+        super().server_close()
+
+
+class FaceGroupingHandler(BaseHTTPRequestHandler):
+    server_version = 'FaceGrouper/1.0'
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(HTTPStatus.OK, {'status': 'ok', 'active_jobs': self.server.jobs.active_count()})
+            return
+
+        match = JOB_PATH.match(self.path)
+        if not match or match.group(2) in ('/cancel', '/search'):
+            self._send_error(HTTPStatus.NOT_FOUND, "Not found")
+            return
+        job_id, action = match.groups()
+        job = self.server.jobs.get(job_id)
+
+        if action is None:
+            if job is None:
+                self._send_error(HTTPStatus.NOT_FOUND, f"Unknown job {job_id}")
+                return
+            job['output_dir'] = job_output_dir(self.server.output_root, job_id)
+            self._send_json(HTTPStatus.OK, job)
+            return
+
+        # The index is read from disk, so results outlive the in-memory job status
+        if job is not None and job['status'] != DONE:
+            self._send_error(HTTPStatus.CONFLICT, f"Job {job_id} is {job['status']}")
+            return
+        index = load_results_index(job_output_dir(self.server.output_root, job_id))
+        if index is None:
+            self._send_error(HTTPStatus.NOT_FOUND, f"No results for job {job_id}")
+            return
+        self._send_json(HTTPStatus.OK, index)
+
+    def do_POST(self):
+        if self.path == '/jobs':
+            try:
+                source_folder, sources = parse_submission(self._read_json())
+            except BadRequest as e:
+                self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+                return
+            job_id = self.server.submit(source_folder, sources)
+            self._send_json(HTTPStatus.ACCEPTED, {'id': job_id, 'status_url': f'/jobs/{job_id}',
+                                                  'groups_url': f'/jobs/{job_id}/groups'})
+            return
+
+        match = JOB_PATH.match(self.path)
+        if match and match.group(2) == '/cancel':
+            self._cancel(match.group(1))
+        elif match and match.group(2) == '/search':
+            self._search(match.group(1))
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, "Not found")
+
+    def do_DELETE(self):
+        match = JOB_PATH.match(self.path)
+        if match and match.group(2) is None:
+            self._cancel(match.group(1))
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, "Not found")
+
+    def _cancel(self, job_id):
+        if self.server.jobs.get(job_id) is None:
+            self._send_error(HTTPStatus.NOT_FOUND, f"Unknown job {job_id}")
+            return
+        cancelled = self.server.jobs.cancel(job_id)
+        self._send_json(HTTPStatus.ACCEPTED if cancelled else HTTPStatus.CONFLICT,
+                        {'id': job_id, 'cancelled': cancelled})
+
+    def _search(self, job_id):
+        job = self.server.jobs.get(job_id)
+        if job is not None and job['status'] != DONE:
+            self._send_error(HTTPStatus.CONFLICT, f"Job {job_id} is {job['status']}")
+            return
+        try:
+            payload = self._read_json()
+            if not isinstance(payload, dict) or 'image' not in payload:
+                raise BadRequest("Expected {\"image\": \"<base64>\"}")
+            top_k = payload.get('top_k', 10)
+            if not isinstance(top_k, int) or top_k < 1:
+                raise BadRequest("top_k must be a positive integer")
+            image = read_image(BufferSource('query', base64.b64decode(payload['image'], validate=True)))
+            if image is None:
+                raise BadRequest("Can't decode the query image")
+        except (TypeError, binascii.Error) as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, f"Invalid image: {e}")
+            return
+        except BadRequest as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+
+        index = self.server.search_index(job_id)
+        if index is None:
+            self._send_error(HTTPStatus.NOT_FOUND, f"No search index for job {job_id}")
+            return
+        results = search_image(index, image, top_k, self.server.face_app)
+        if results is None:
+            self._send_error(HTTPStatus.UNPROCESSABLE_ENTITY, "No face found in the query image")
+            return
+        self._send_json(HTTPStatus.OK, results)
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            raise BadRequest("Invalid Content-Length")
+        if length > SERVER_MAX_REQUEST_BYTES:
+            raise BadRequest(f"Request body larger than {SERVER_MAX_REQUEST_BYTES} bytes")
+        try:
+            return json.loads(self.rfile.read(length) or b'null')
+        except ValueError as e:
+            raise BadRequest(f"Invalid JSON: {e}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {'error': message})
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} - {format % args}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP API for face grouping jobs")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--output-root', default=SERVER_OUTPUT_ROOT,
+                        help="Folder the results of each job are written to (one subfolder per job)")
+    parser.add_argument('--max-jobs', type=int, default=MAX_CONCURRENT_JOBS,
+                        help="Jobs running at the same time; further jobs are queued")
+    parser.add_argument('--no-warm-up', action='store_true',
+                        help="Load models on the first job instead of at startup")
+    args = parser.parse_args(argv)
+
+    server = FaceGroupingServer((args.host, args.port), args.output_root, args.max_jobs)
+    if not args.no_warm_up:
+        # Load the models before accepting jobs so job latency excludes model loading
+        server.face_app.warm_up(args.max_jobs)
+    logger.info(f"Serving face grouping API on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
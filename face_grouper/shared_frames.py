@@ -0,0 +1,206 @@
+# shared_frames.py - Decode images in worker processes, handing pixels over through shared memory
+import os
+import sys
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from .config import DECODE_SLOT_BYTES
+from .logger import get_logger
+from .sources import read_image
+
+logger = get_logger(__name__)
+
+SHM_ROOT = '/dev/shm'
+DRAIN_TIMEOUT = 30.0
+WORKER_POLL_INTERVAL = 1.0
+
+
+def _shm_available():
+    """Free bytes for shared memory, or None where that can't be told (non-Linux)."""
+    if not sys.platform.startswith('linux') or not os.path.isdir(SHM_ROOT):
+        return None
+    stat = os.statvfs(SHM_ROOT)
+    return stat.f_bavail * stat.f_frsize
+
+
+def _decode_worker(shm_name, slot_bytes, tasks, free_slots, ready):
+    """Worker process: decode images into free ring slots and report (index, slot, shape, dtype)."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            index, path = task
+            try:
+                image = read_image(path)
+            except Exception:
+                image = None
+            if image is None:
+                ready.put((index, None, None, None))
+                continue
+            if image.nbytes > slot_bytes:
+                # Too large for a slot: let the consumer decode it itself rather than pickle it
+                ready.put((index, -1, None, None))
+                continue
+            slot = free_slots.get()
+            view = np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf, offset=slot * slot_bytes)
+            view[...] = image
+            del view
+            ready.put((index, slot, image.shape, image.dtype.str))
+    finally:
+        shm.close()
+
+
+class SharedFrameDecoder:
+    """
+    Decodes image files in worker processes into a shared-memory ring buffer.
+
+    The ring holds `slots` fixed-size slots. A worker decodes a file, copies
+    the pixels into a free slot and sends only the slot index, shape and
+    dtype back; the consumer reads the image in place as a numpy view, so no
+    pixels are pickled between processes. At most `slots` images are in
+    flight, which keeps the ring from filling up with out-of-order results.
+
+    Use it as a context manager and iterate imap(); images larger than
+    slot_bytes (or sources marked local) are yielded without pixels and
+    should be decoded by the consumer. If a worker dies (e.g. OOM-killed),
+    the decoder is marked broken and everything not yet decoded is handed
+    to the consumer the same way, instead of waiting for it forever.
+    """
+
+    def __init__(self, workers, slots=None, slot_bytes=DECODE_SLOT_BYTES):
+        self.workers = workers
+        self.slots = slots or workers + 2
+        self.slot_bytes = slot_bytes
+        self.broken = False
+
+        available = _shm_available()
+        if available is not None and self.slots * slot_bytes > available:
+            # Writing past the tmpfs limit would crash the workers with SIGBUS
+            self.slots = max(1, int(available // slot_bytes))
+            if available < slot_bytes:
+                raise OSError(f"Not enough shared memory in {SHM_ROOT} for one {slot_bytes} byte frame slot")
+            logger.warning(f"Only {available // (1024 * 1024)} MB of shared memory free, using {self.slots} slots")
+
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * slot_bytes)
+        context = multiprocessing.get_context('spawn')
+        self._tasks = context.Queue()
+        self._free_slots = context.Queue()
+        self._ready = context.Queue()
+        for slot in range(self.slots):
+            self._free_slots.put(slot)
+        self._processes = [
+            context.Process(target=_decode_worker, daemon=True,
+                            args=(self._shm.name, slot_bytes, self._tasks, self._free_slots, self._ready))
+            for _ in range(workers)
+        ]
+        for process in self._processes:
+            process.start()
+        logger.info(f"Started {workers} decode workers with {self.slots} x {slot_bytes // (1024 * 1024)} MB frame slots")
+
+    def _dead_worker(self):
+        """A worker process that has exited (workers only stop in close()), or None."""
+        return next((process for process in self._processes if process.exitcode is not None), None)
+
+    def _view(self, slot, shape, dtype):
+        return np.ndarray(shape, dtype=np.dtype(dtype), buffer=self._shm.buf, offset=slot * self.slot_bytes)
+
+    def imap(self, sources, local=None):
+        """
+        Yield (source, image) in the order of sources.
+
+        image is a view into the ring, valid until the next item is requested.
+        It is None when the consumer should decode the source itself: sources
+        where local(source) is true (never sent to a worker), images larger
+        than a slot, files a worker couldn't decode (decoding those again
+        reports the failure the usual way) and, once a worker died, every
+        source not decoded yet.
+        """
+        sources = iter(sources)
+        pending = {}      # index -> source, in flight or waiting to be yielded
+        finished = {}     # index -> (slot, shape, dtype) for results that arrived early
+        next_index = 0    # next index to yield
+        submitted = 0
+        exhausted = False
+        current_slot = None
+        try:
+            while True:
+                # The previous image is no longer used once the next one is requested
+                if current_slot is not None:
+                    self._free_slots.put(current_slot)
+                    current_slot = None
+
+                # Keep up to `slots` sources in flight so every one of them can get a slot
+                while not exhausted and len(pending) < self.slots:
+                    source = next(sources, None)
+                    if source is None:
+                        exhausted = True
+                        break
+                    pending[submitted] = source
+                    if self.broken or (local is not None and local(source)):
+                        finished[submitted] = (None, None, None)
+                    else:
+                        self._tasks.put((submitted, source))
+                    submitted += 1
+                if next_index == submitted:
+                    break
+
+                while next_index not in finished:
+                    try:
+                        index, slot, shape, dtype = self._ready.get(timeout=WORKER_POLL_INTERVAL)
+                    except queue.Empty:
+                        dead = self._dead_worker()
+                        if dead is None:
+                            continue
+                        # Its task is lost and can't be told apart from the others still queued
+                        logger.warning(f"Decode worker {dead.pid} died (exit code {dead.exitcode}), "
+                                       f"decoding the remaining images in this process")
+                        self.broken = True
+                        for index in pending:
+                            finished.setdefault(index, (None, None, None))
+                        break
+                    finished[index] = (slot, shape, dtype)
+
+                slot, shape, dtype = finished.pop(next_index)
+                source = pending.pop(next_index)
+                next_index += 1
+                if slot is None or slot < 0:
+                    yield source, None
+                else:
+                    current_slot = slot
+                    yield source, self._view(slot, shape, dtype)
+        finally:
+            if current_slot is not None:
+                self._free_slots.put(current_slot)
+            # Results still in flight belong to an abandoned iteration; drain them so
+            # their slots are returned and the decoder can be reused
+            outstanding = 0 if self.broken else len(pending) - sum(1 for i in pending if i in finished)
+            for slot, _, _ in finished.values():
+                if slot is not None and slot >= 0:
+                    self._free_slots.put(slot)
+            for _ in range(outstanding):
+                try:
+                    _, slot, _, _ = self._ready.get(timeout=DRAIN_TIMEOUT)
+                except queue.Empty:
+                    logger.warning("Decode workers stopped responding, abandoning their frames")
+                    break
+                if slot is not None and slot >= 0:
+                    self._free_slots.put(slot)
+
+    def close(self):
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
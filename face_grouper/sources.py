@@ -0,0 +1,138 @@
+# sources.py - Image sources: files on disk or images held in memory
+import os
+import shutil
+import hashlib
+import cv2
+import numpy as np
+
+
+class BufferSource:
+    """
+    An encoded image held in memory, e.g. a Streamlit upload.
+
+    The pixels are decoded straight from the buffer and the bytes are only
+    written to disk when the organizer places the image in an output folder.
+    """
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = memoryview(data)
+        self.digest = hashlib.sha1(self.data).hexdigest()
+
+    @property
+    def key(self):
+        return f"buffer:{self.digest}/{self.name}"
+
+    def __repr__(self):
+        return f"BufferSource({self.name!r}, {self.data.nbytes} bytes)"
+
+
+class VideoFrameSource(BufferSource):
+    """
+    A frame sampled from a video, held as an encoded JPEG.
+
+    It behaves like any other in-memory source: the frame is what gets placed
+    in a group folder, under a name derived from the video and the timestamp.
+    The key identifies the video and frame, so reruns map it to the same file.
+    """
+
+    def __init__(self, video_path, frame_index, timestamp, data):
+        stem = os.path.splitext(os.path.basename(video_path))[0]
+        minutes, seconds = divmod(int(timestamp), 60)
+        super().__init__(f"{stem}_{minutes:02d}m{seconds:02d}s_f{frame_index}.jpg", data)
+        self.video_path = video_path
+        self.frame_index = frame_index
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_frame(cls, video_path, frame_index, timestamp, frame, quality=95):
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError(f"Can't encode frame {frame_index} of {video_path}")
+        return cls(video_path, frame_index, timestamp, encoded.tobytes())
+
+    @classmethod
+    def from_video(cls, video_path, frame_index, timestamp):
+        """Decode frame frame_index of the video again, or None if it can't be read."""
+        capture = cv2.VideoCapture(video_path)
+        try:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            ok, frame = capture.read()
+        finally:
+            capture.release()
+        if not ok:
+            return None
+        return cls.from_frame(video_path, frame_index, timestamp, frame)
+
+    @property
+    def key(self):
+        return f"video:{os.path.abspath(self.video_path)}#{self.frame_index}"
+
+    def __reduce__(self):
+        # memoryviews can't be pickled (e.g. into the stage cache); keep the bytes instead
+        return (VideoFrameSource, (self.video_path, self.frame_index, self.timestamp, bytes(self.data)))
+
+    def __repr__(self):
+        return f"VideoFrameSource({self.video_path!r}, frame {self.frame_index})"
+
+
+class ScannedPath(str):
+    """
+    A file path found by a folder scan (see discovery.py), carrying the size
+    and mtime read from its directory entry, so change detection doesn't
+    stat the file again.
+    """
+
+    def __new__(cls, path, size, mtime_ns):
+        self = super().__new__(cls, path)
+        self.size = size
+        self.mtime_ns = mtime_ns
+        return self
+
+    def __reduce__(self):
+        return (ScannedPath, (str(self), self.size, self.mtime_ns))
+
+
+def source_key(source):
+    """Stable identity of a source: absolute path for files, content hash for buffers."""
+    if isinstance(source, BufferSource):
+        return source.key
+    if isinstance(source, ScannedPath):
+        return ScannedPath(os.path.abspath(source), source.size, source.mtime_ns)
+    return os.path.abspath(source)
+
+
+def source_name(source):
+    """File name a source should be saved under."""
+    if isinstance(source, BufferSource):
+        return os.path.basename(source.name)
+    return os.path.basename(source)
+
+
+def source_exists(source):
+    if isinstance(source, BufferSource):
+        return True
+    return os.path.exists(source)
+
+
+def source_size(source):
+    if isinstance(source, BufferSource):
+        return source.data.nbytes
+    return os.path.getsize(source)
+
+
+def read_image(source):
+    """Decode a source into a BGR image, or None if it can't be decoded."""
+    if isinstance(source, BufferSource):
+        # np.frombuffer wraps the upload's memory without copying it
+        return cv2.imdecode(np.frombuffer(source.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(source)
+
+
+def write_source(source, dst):
+    """Write the original bytes of a source to dst."""
+    if isinstance(source, BufferSource):
+        with open(dst, 'wb') as f:
+            f.write(source.data)
+    else:
+        shutil.copy2(source, dst)
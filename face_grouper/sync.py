@@ -0,0 +1,278 @@
+# sync.py - Incremental synchronization of the output directory
+import os
+import json
+import shutil
+import hashlib
+from .logger import get_logger
+from .sources import BufferSource, ScannedPath, source_key, source_name
+from .jobs import check_cancelled
+from .placement import place_files
+
+logger = get_logger(__name__)
+
+MANIFEST_NAME = '.face_grouper_manifest.json'
+THUMBNAIL_NAME = 'thumbnail.jpg'
+STAGING_SUFFIX = '.sync'
+RETIRED_SUFFIX = '.old'
+
+
+def output_name(source):
+    """
+    Stable file name for a source image inside a group folder.
+    The same source always maps to the same name, so reruns can recognise it.
+    """
+    digest = hashlib.sha1(source_key(source).encode('utf-8')).hexdigest()[:10]
+    return f"{digest}_{source_name(source)}"
+
+
+def source_fingerprint(source):
+    """Describe a source so changes to it can be detected on the next run."""
+    if isinstance(source, BufferSource):
+        # The key already contains a content hash
+        return {'source': source.key, 'size': source.data.nbytes, 'mtime_ns': 0}
+    if isinstance(source, ScannedPath):
+        # Size and mtime were read while scanning the folder
+        return {'source': str(source_key(source)), 'size': source.size, 'mtime_ns': source.mtime_ns}
+    stat = os.stat(source)
+    return {
+        'source': source_key(source),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+
+
+def _fingerprint_key(fingerprint):
+    return (fingerprint['source'], fingerprint['size'], fingerprint['mtime_ns'])
+
+
+def load_manifest(output_dir):
+    """Load the manifest describing what the previous run placed in output_dir."""
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    """Atomically write the manifest (temp file + rename)."""
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def assign_group_folders(groups, manifest, prefix='person_'):
+    """
+    Map each group onto a folder name, reusing the folder of the previous run
+    that shares the most files with it so reruns don't renumber everybody.
+
+    Args:
+        groups: List of lists of sources, largest group first
+        manifest: Manifest loaded from the previous run
+        prefix: Folder name prefix for groups
+
+    Returns:
+        List of folder names, one per group
+    """
+    previous = {}
+    for folder, entries in manifest.items():
+        if folder.startswith(prefix):
+            previous[folder] = {entry['source'] for entry in entries.values()}
+
+    used = set()
+    folders = [None] * len(groups)
+
+    # Largest groups pick first, each taking its best-overlapping previous folder
+    for i, sources in enumerate(groups):
+        sources = {source_key(source) for source in sources}
+        best_folder, best_overlap = None, 0
+        for folder, members in previous.items():
+            if folder in used:
+                continue
+            overlap = len(sources & members)
+            if overlap > best_overlap:
+                best_folder, best_overlap = folder, overlap
+        if best_folder is not None:
+            folders[i] = best_folder
+            used.add(best_folder)
+
+    # Remaining groups get fresh numbers after the highest one in use
+    taken = set(previous) | used
+    next_number = 1
+    for i in range(len(groups)):
+        if folders[i] is not None:
+            continue
+        while f'{prefix}{next_number}' in taken:
+            next_number += 1
+        folders[i] = f'{prefix}{next_number}'
+        taken.add(folders[i])
+
+    return folders
+
+
+def _link_or_copy(src, dst):
+    """Hard-link src to dst, falling back to a copy where links aren't supported."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _recover_interrupted(output_dir):
+    """Restore or discard staging folders left behind by an interrupted run."""
+    for name in os.listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        if not name.startswith('.') or not os.path.isdir(path):
+            continue
+        if name.endswith(RETIRED_SUFFIX):
+            live = os.path.join(output_dir, name[1:-len(RETIRED_SUFFIX)])
+            if not os.path.exists(live):
+                os.rename(path, live)
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+        elif name.endswith(STAGING_SUFFIX):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def sync_output(output_dir, layout, is_managed, make_thumbnail=None, max_workers=None, should_cancel=None,
+                refresh_thumbnails=False):
+    """
+    Bring output_dir in line with the desired layout, touching only what changed.
+
+    Every group that differs from the previous run is assembled in a staging
+    folder (hard-linking files that are already placed, copying only new ones)
+    and then swapped in with a rename, so each group changes atomically.
+    Managed folders that are no longer part of the layout are removed.
+
+    Args:
+        output_dir: Output directory path
+        layout: Dict of folder name -> {output file name: source}
+        is_managed: Predicate telling which folder names this call owns
+        make_thumbnail: Optional callable (folder, staging_path) that writes a
+            thumbnail into the staging folder when a group's members changed
+        max_workers: Number of concurrent file copies (default: config.PLACEMENT_WORKERS)
+        should_cancel: Optional callable checked while staging; a cancelled
+            sync discards its staging folders and leaves the output untouched
+        refresh_thumbnails: Remake every thumbnail, also for unchanged groups
+            (e.g. after a thumbnail size change)
+
+    Returns:
+        Dict with counts of added (copied successfully), failed, moved,
+        deleted and kept files, the number of folders changed ('synced') and
+        the file placement summary under 'placement'
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    _recover_interrupted(output_dir)
+    manifest = load_manifest(output_dir)
+    stats = {'added': 0, 'failed': 0, 'moved': 0, 'deleted': 0, 'kept': 0, 'synced': 0}
+
+    # Index every file the previous run placed so it can be reused from any folder
+    placed = {}
+    for folder, entries in manifest.items():
+        for name, fingerprint in entries.items():
+            path = os.path.join(output_dir, folder, name)
+            if os.path.exists(path):
+                placed.setdefault(_fingerprint_key(fingerprint), []).append((folder, path))
+
+    staged = {}
+    copies, copied = [], []
+    thumbnails = []
+    new_manifest = {folder: entries for folder, entries in manifest.items() if not is_managed(folder)}
+
+    try:
+        for folder, desired in layout.items():
+            live_path = os.path.join(output_dir, folder)
+            fingerprints = {name: source_fingerprint(src) for name, src in desired.items()}
+            new_manifest[folder] = fingerprints
+            previous = manifest.get(folder, {})
+
+            live_names = set()
+            if os.path.isdir(live_path):
+                live_names = set(os.listdir(live_path)) - {THUMBNAIL_NAME}
+            has_thumbnail = not refresh_thumbnails and os.path.exists(os.path.join(live_path, THUMBNAIL_NAME))
+            members_unchanged = previous == fingerprints and live_names == set(desired)
+
+            if members_unchanged and (has_thumbnail or make_thumbnail is None):
+                stats['kept'] += len(desired)
+                continue
+
+            check_cancelled(should_cancel)
+            staging_path = os.path.join(output_dir, f'.{folder}{STAGING_SUFFIX}')
+            os.makedirs(staging_path)
+            staged[folder] = staging_path
+            for name, fingerprint in fingerprints.items():
+                dst = os.path.join(staging_path, name)
+                candidates = placed.get(_fingerprint_key(fingerprint), [])
+                same_folder = [path for f, path in candidates if f == folder and os.path.basename(path) == name]
+                if same_folder:
+                    _link_or_copy(same_folder[0], dst)
+                    stats['kept'] += 1
+                elif candidates:
+                    _link_or_copy(candidates[0][1], dst)
+                    stats['moved'] += 1
+                else:
+                    copies.append((desired[name], dst))
+                    copied.append((folder, name))
+            stats['deleted'] += len(live_names - set(desired))
+
+            if make_thumbnail is not None:
+                if members_unchanged and has_thumbnail:
+                    _link_or_copy(os.path.join(live_path, THUMBNAIL_NAME), os.path.join(staging_path, THUMBNAIL_NAME))
+                else:
+                    thumbnails.append((folder, staging_path))
+
+        # New files for all groups go through one concurrent placement pass
+        stats['placement'] = place_files(copies, max_workers=max_workers, should_cancel=should_cancel)
+        # Only copies that succeeded count as added; failures are reported separately
+        stats['added'] = stats['placement']['files']
+        stats['failed'] = stats['placement']['failed']
+        # Files that failed to copy stay out of the manifest, so the next run copies them again
+        for (folder, name), (_, dst) in zip(copied, copies):
+            if not os.path.exists(dst):
+                del new_manifest[folder][name]
+        for folder, staging_path in thumbnails:
+            check_cancelled(should_cancel)
+            make_thumbnail(folder, staging_path)
+    except BaseException:
+        # Leave the live folders as they were and discard the half-built groups
+        for staging_path in staged.values():
+            shutil.rmtree(staging_path, ignore_errors=True)
+        raise
+
+    # Swap staged groups in and retire folders that are no longer wanted
+    retired = []
+    for folder, staging_path in staged.items():
+        live_path = os.path.join(output_dir, folder)
+        if os.path.exists(live_path):
+            retired_path = os.path.join(output_dir, f'.{folder}{RETIRED_SUFFIX}')
+            os.rename(live_path, retired_path)
+            retired.append(retired_path)
+        os.rename(staging_path, live_path)
+
+    for folder in os.listdir(output_dir):
+        live_path = os.path.join(output_dir, folder)
+        if folder in layout or folder.startswith('.') or not is_managed(folder) or not os.path.isdir(live_path):
+            continue
+        stats['deleted'] += len(set(os.listdir(live_path)) - {THUMBNAIL_NAME})
+        stats['synced'] += 1
+        retired_path = os.path.join(output_dir, f'.{folder}{RETIRED_SUFFIX}')
+        os.rename(live_path, retired_path)
+        retired.append(retired_path)
+
+    for retired_path in retired:
+        shutil.rmtree(retired_path, ignore_errors=True)
+
+    stats['synced'] += len(staged)
+    save_manifest(output_dir, new_manifest)
+    logger.info(
+        f"Synced {len(staged)} of {len(layout)} folders in {output_dir}: "
+        f"{stats['added']} added, {stats['moved']} moved, {stats['deleted']} deleted, {stats['kept']} kept, "
+        f"{stats['failed']} failed"
+    )
+    return stats
@@ -0,0 +1,187 @@
+# video.py - Face detection in videos: frame sampling and temporal deduplication
+import os
+import cv2
+import numpy as np
+from .config import (VIDEO_EXTENSIONS, VIDEO_SAMPLING, VIDEO_SAMPLE_FPS, VIDEO_SCENE_THRESHOLD,
+                     VIDEO_SCENE_MAX_INTERVAL, VIDEO_DUPLICATE_THRESHOLD, VIDEO_TRACK_SIMILARITY,
+                     VIDEO_TRACK_MAX_GAP)
+from .detector import detect_faces, extract_face_embedding
+from .logger import get_logger
+from .metrics import measure
+from .sources import BufferSource, VideoFrameSource, read_image
+
+logger = get_logger(__name__)
+
+
+def is_video(source):
+    if isinstance(source, BufferSource):
+        return False
+    return os.path.splitext(source)[1].lower() in VIDEO_EXTENSIONS
+
+
+def _signature(frame):
+    """Tiny grayscale version of a frame for near-duplicate checks."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def _histogram(frame):
+    """Normalized hue/saturation histogram for scene change detection."""
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [32, 32], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+
+def sample_frames(video_path, mode=VIDEO_SAMPLING, fps=VIDEO_SAMPLE_FPS, scene_threshold=VIDEO_SCENE_THRESHOLD,
+                  max_interval=VIDEO_SCENE_MAX_INTERVAL, duplicate_threshold=VIDEO_DUPLICATE_THRESHOLD):
+    """
+    Yield the frames of a video worth running face detection on.
+
+    Candidate frames are taken at fps; frames in between are skipped without
+    being decoded. In 'scene' mode a candidate is only used if it starts a new
+    scene (hue/saturation histogram distance above scene_threshold) or
+    max_interval seconds passed since the last used frame. In both modes
+    candidates nearly identical to the last used frame (mean absolute pixel
+    difference below duplicate_threshold on a 32x32 thumbnail) are skipped.
+
+    Yields:
+        (frame_index, timestamp in seconds, BGR frame) tuples
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise OSError(f"Can't open video {video_path}")
+    try:
+        video_fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        step = max(1, int(round(video_fps / fps)))
+        last_signature, last_histogram, last_timestamp = None, None, None
+
+        frame_index = -1
+        while True:
+            frame_index += 1
+            if frame_index % step:
+                # grab() advances without decoding the frame
+                if not capture.grab():
+                    break
+                continue
+            ok, frame = capture.read()
+            if not ok:
+                break
+            timestamp = frame_index / video_fps
+
+            signature = _signature(frame)
+            if last_signature is not None and np.mean(np.abs(signature - last_signature)) < duplicate_threshold:
+                continue
+            if mode == 'scene' and last_histogram is not None:
+                histogram = _histogram(frame)
+                scene_change = cv2.compareHist(last_histogram, histogram, cv2.HISTCMP_BHATTACHARYYA) > scene_threshold
+                if not scene_change and timestamp - last_timestamp < max_interval:
+                    continue
+                last_histogram = histogram
+            elif mode == 'scene':
+                last_histogram = _histogram(frame)
+
+            last_signature, last_timestamp = signature, timestamp
+            yield frame_index, timestamp, frame
+    finally:
+        capture.release()
+
+
+class FaceTracker:
+    """
+    Collapses detections of the same face in consecutive sampled frames into tracks.
+
+    A detection joins the active track whose last embedding is most similar
+    (at least min_similarity) if that track was seen within max_gap seconds;
+    otherwise it starts a new track. Each track keeps the running sum of its
+    embeddings and the frame with its most confident detection, JPEG-encoded
+    as soon as it becomes the best one, so a long video holds one compressed
+    frame per track rather than decoded frames.
+    """
+
+    def __init__(self, video_path, min_similarity=VIDEO_TRACK_SIMILARITY, max_gap=VIDEO_TRACK_MAX_GAP):
+        self.video_path = video_path
+        self.min_similarity = min_similarity
+        self.max_gap = max_gap
+        self.tracks = []
+
+    def update(self, frame_index, timestamp, frame, faces):
+        active = [t for t in self.tracks if timestamp - t['last_seen'] <= self.max_gap]
+        claimed = set()
+        for face in faces:
+            embedding = extract_face_embedding(face)
+            embedding = embedding / max(np.linalg.norm(embedding), 1e-12)
+            best, best_similarity = None, self.min_similarity
+            for track in active:
+                if id(track) in claimed:
+                    continue
+                similarity = float(np.dot(track['last_embedding'], embedding))
+                if similarity >= best_similarity:
+                    best, best_similarity = track, similarity
+            if best is None:
+                best = {'embedding_sum': np.zeros_like(embedding), 'count': 0, 'score': -1.0}
+                self.tracks.append(best)
+            claimed.add(id(best))
+
+            best['embedding_sum'] = best['embedding_sum'] + embedding
+            best['count'] += 1
+            best['last_embedding'] = embedding
+            best['last_seen'] = timestamp
+            score = float(face.det_score or 0.0)
+            if score > best['score']:
+                best.update(score=score, face=face,
+                            source=VideoFrameSource.from_frame(self.video_path, frame_index, timestamp, frame))
+
+    def results(self):
+        """
+        One (VideoFrameSource, face) pair per track: the best frame and its face,
+        with the face's embedding replaced by the track's mean embedding.
+        """
+        results = []
+        for track in self.tracks:
+            face = type(track['face'])(track['face'])
+            face['embedding'] = track['embedding_sum'] / track['count']
+            results.append((track['source'], face))
+        return results
+
+
+def detect_video(video_path, face_app=None, metrics=None, crop_store=None):
+    """
+    Detect the people in a video as face tracks.
+
+    With a crop_store (see crops.py) the face of each track is saved from
+    the frame that represents it.
+
+    Returns:
+        List of (VideoFrameSource, face) tuples, one per track, or None if the
+        video can't be read
+    """
+    tracker = FaceTracker(video_path)
+    frames = 0
+    try:
+        samples = sample_frames(video_path)
+        while True:
+            with measure(metrics, 'decode'):
+                sample = next(samples, None)
+            if sample is None:
+                break
+            frame_index, timestamp, frame = sample
+            with measure(metrics, 'inference'):
+                faces = detect_faces(frame, face_app)
+            tracker.update(frame_index, timestamp, frame, faces)
+            frames += 1
+    except (OSError, cv2.error) as e:
+        logger.warning(f"Failed to read video {video_path}: {e}")
+        if metrics is not None:
+            metrics.add('unreadable_videos')
+        return None
+
+    detections = tracker.results()
+    if crop_store is not None:
+        crop_store.add(video_path, [(read_image(source), face) for source, face in detections])
+    logger.info(f"{os.path.basename(video_path)}: {frames} frames sampled, {len(detections)} face tracks")
+    if metrics is not None:
+        metrics.add('videos')
+        metrics.add('video_frames', frames)
+        metrics.add('faces', len(detections))
+        metrics.add('no_face_images', 0 if detections else 1)
+    return detections
@@ -2,13 +2,36 @@ import streamlit as st
 import os
 from PIL import Image
 import base64
-from face_grouper.gdrive_utils import download_gdrive_folder
-from face_grouper.main import run_pipeline
+import json
+import re
+import shutil
+import uuid
+from face_grouper.atlas import atlas_index_path, ATLAS_DIR
+from face_grouper.config import MAX_CONCURRENT_JOBS
+from face_grouper.detector import FaceAppPool
+from face_grouper.inference import InferenceService
+from face_grouper.gdrive_utils import GDriveDownloadStream
+from face_grouper.jobs import JobManager, QUEUED, RUNNING, DONE, CANCELLED
+from face_grouper.main import PREVIEW_DIR, run_pipeline
+from face_grouper.results import load_results_index, results_index_path
+from face_grouper.sources import BufferSource
 
-# Directories
+# Directories (each browser session works inside its own workspace folder)
+WORKSPACE_ROOT = "workspaces"
 DOWNLOAD_DIR = "downloaded_photos"
 OUTPUT_DIR = "output_faces"
 
+# Atlas sheets are copied here and served by Streamlit's static file serving
+# (server.enableStaticServing), so browsers fetch and cache them like any image
+STATIC_ATLAS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "atlas")
+STATIC_ATLAS_URL = "app/static/atlas"
+
+# Photos per page in the person detail view
+DETAIL_PAGE_SIZE = 24
+
+# How often the page polls a running background job
+JOB_POLL_SECONDS = 1.0
+
 st.set_page_config(
     page_title="Face Grouping Tool", 
     page_icon="ðŸ‘ï¸",
@@ -380,21 +403,133 @@ if "selected_person" not in st.session_state:
     st.session_state.selected_person = None
 if "is_processing" not in st.session_state:
     st.session_state.is_processing = False
+if "detail_page" not in st.session_state:
+    st.session_state.detail_page = 0
+if "workspace_id" not in st.session_state:
+    # Keep the workspace across browser refreshes via the URL
+    workspace_id = st.query_params.get("ws", "")
+    if not re.fullmatch(r"[0-9a-f]{32}", workspace_id):
+        workspace_id = uuid.uuid4().hex
+        st.query_params["ws"] = workspace_id
+    st.session_state.workspace_id = workspace_id
+if "job_id" not in st.session_state:
+    # Reattach to a running job after a browser refresh
+    st.session_state.job_id = st.query_params.get("job")
+    st.session_state.is_processing = st.session_state.job_id is not None
 
 # Load CSS
 inject_modern_css()
 
 # Utility functions
+def session_dir(name):
+    """Path of a working directory inside this session's workspace"""
+    return os.path.join(WORKSPACE_ROOT, st.session_state.workspace_id, name)
+
+@st.cache_resource
+def get_model_pool():
+    """One process-wide inference service, shared by all sessions' jobs (recognition is batched across them)"""
+    # No more jobs than that run at once, so more instances would only sit idle
+    return InferenceService(FaceAppPool(size=MAX_CONCURRENT_JOBS))
+
 def encode_image_base64(image_path):
     """Convert image to base64 string"""
     with open(image_path, "rb") as img_file:
         return base64.b64encode(img_file.read()).decode()
 
-def create_thumbnail_button(person_folder, folder_path, index):
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_groups_index(output_dir, version):
+    """Load the results index; cached until the index (or output folder) changes"""
+    return load_results_index(output_dir)
+
+def groups_index_version(output_dir):
+    """Modification time identifying the current results index, or None if there are no results"""
+    index_path = results_index_path(output_dir)
+    if os.path.exists(index_path):
+        return os.path.getmtime(index_path)
+    elif os.path.isdir(output_dir):
+        return os.path.getmtime(output_dir)
+    return None
+
+def results_dir():
+    """Folder whose groups are shown: the provisional results of a running progressive job, else the output"""
+    output_dir = session_dir(OUTPUT_DIR)
+    preview_dir = os.path.join(output_dir, PREVIEW_DIR)
+    if st.session_state.is_processing and os.path.exists(results_index_path(preview_dir)):
+        return preview_dir
+    return output_dir
+
+def get_groups_index():
+    """Return the results index for this session's output with a single stat per rerun"""
+    output_dir = results_dir()
+    version = groups_index_version(output_dir)
+    st.session_state.groups_version = version
+    if version is None:
+        return None
+    return load_groups_index(output_dir, version)
+
+def find_group(index, person_folder):
+    """Look up a group entry in the results index"""
+    for group in index["groups"] if index else []:
+        if group["folder"] == person_folder:
+            return group
+    return None
+
+@st.cache_data(show_spinner=False)
+def load_thumbnail_atlas(output_dir, workspace_id, index_mtime):
+    """Publish the atlas sheets as static files and return the atlas index with a CSS block referencing them (cached per atlas version)"""
+    with open(atlas_index_path(output_dir), "r", encoding="utf-8") as f:
+        atlas = json.load(f)
+    
+    # Versioned file names, so browsers can cache a sheet for good and a new atlas is fetched fresh
+    static_dir = os.path.join(STATIC_ATLAS_DIR, workspace_id)
+    os.makedirs(static_dir, exist_ok=True)
+    version = f"{int(index_mtime * 1000):x}"
+    published = set()
+    rules = []
+    for number, sheet in enumerate(atlas["sheets"]):
+        name = f"{version}-{sheet}"
+        shutil.copyfile(os.path.join(output_dir, ATLAS_DIR, sheet), os.path.join(static_dir, name))
+        published.add(name)
+        rules.append(f".atlas-sheet-{number} {{ background-image: url({STATIC_ATLAS_URL}/{workspace_id}/{name}); }}")
+    for name in os.listdir(static_dir):
+        if name not in published:
+            os.remove(os.path.join(static_dir, name))
+    return atlas, "<style>" + "\n".join(rules) + "</style>"
+
+def get_thumbnail_atlas():
+    """Return the current atlas index, or None if the organizer hasn't written one"""
+    output_dir = results_dir()
+    index_path = atlas_index_path(output_dir)
+    if not os.path.exists(index_path):
+        return None
+    try:
+        atlas, css = load_thumbnail_atlas(output_dir, st.session_state.workspace_id, os.path.getmtime(index_path))
+    except (OSError, ValueError, KeyError):
+        return None
+    st.markdown(css, unsafe_allow_html=True)
+    return atlas
+
+def render_atlas_tile(atlas, person_folder, caption):
+    """Render one thumbnail as a window onto an atlas sheet; returns False if it isn't packed"""
+    tile = atlas["tiles"].get(person_folder) if atlas else None
+    if tile is None:
+        return False
+    width, height = atlas["tile_size"]
+    st.markdown(f"""
+    <div style="text-align: center;">
+        <div class="atlas-sheet-{tile['sheet']}" style="width: {width}px; height: {height}px; margin: 0 auto;
+             border-radius: 16px; background-position: -{tile['x']}px -{tile['y']}px;"></div>
+        <p class="thumbnail-count">{caption}</p>
+    </div>
+    """, unsafe_allow_html=True)
+    return True
+
+def create_thumbnail_button(group, index, atlas=None):
     """Create an enhanced thumbnail button with hover effects"""
-    thumbnail_path = os.path.join(folder_path, "thumbnail.jpg")
-    if os.path.exists(thumbnail_path):
-        image_count = len([f for f in os.listdir(folder_path) if f != "thumbnail.jpg"])
+    if group["thumbnail"]:
+        person_folder = group["folder"]
+        thumbnail_path = os.path.join(results_dir(), group["thumbnail"])
+        image_count = group["count"]
         person_name = f"Person {index + 1}"
         
         # Use Streamlit button with custom styling
@@ -403,9 +538,12 @@ def create_thumbnail_button(person_folder, folder_path, index):
             if st.button(person_name, key=f"btn_{person_folder}", use_container_width=True):
                 st.session_state.selected_person = person_folder
                 st.session_state.current_page = "person_detail"
+                st.session_state.detail_page = 0
                 st.rerun()
             
-            # Display thumbnail image
+            # Display thumbnail from the atlas, falling back to the individual file
+            if render_atlas_tile(atlas, person_folder, f"{image_count} photos"):
+                return
             try:
                 thumbnail_img = Image.open(thumbnail_path)
                 st.image(thumbnail_img, use_container_width=True, caption=f"{image_count} photos")
@@ -469,115 +607,149 @@ def show_home_page():
         if st.button("Process Images", disabled=st.session_state.is_processing or not uploaded_images):
             process_uploaded_images(uploaded_images)
     
+    # Progress of the running job, if any
+    show_job_status()
+    
     # Display results
     display_face_groups()
 
-def process_google_drive_images(url):
-    """Process images from Google Drive"""
+@st.cache_resource
+def get_job_manager():
+    """One background job pool per Streamlit server, shared by all sessions"""
+    return JobManager()
+
+def start_job(job_fn, *args, name="job"):
+    """Submit a pipeline job and remember it in the session and the URL (survives refresh)"""
+    job_id = get_job_manager().submit(job_fn, *args, name=name)
+    st.session_state.job_id = job_id
+    st.query_params["job"] = job_id
     st.session_state.is_processing = True
+    st.rerun()
+
+class PreviewNote:
+    """Progressive runs: remembers how many provisional people are shown, for the progress message"""
+    def __init__(self):
+        self.text = ""
     
-    try:
-        with st.spinner("Downloading images..."):
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            def update_download(fraction):
-                progress_bar.progress(fraction)
-                status_text.text(f"Downloading: {int(fraction * 100)}%")
-            
-            download_gdrive_folder(url, DOWNLOAD_DIR, progress_callback=update_download)
-        
-        with st.spinner("Processing faces..."):
-            def update_process(fraction):
-                progress_bar.progress(fraction)
-                status_text.text(f"Processing: {int(fraction * 100)}%")
-            
-            run_pipeline(DOWNLOAD_DIR, OUTPUT_DIR, update_progress=update_process)
-        
-        progress_bar.empty()
-        status_text.empty()
-        st.success("ðŸŽ‰ Processing complete!")
-        
-    except Exception as e:
-        st.error(f"Error processing images: {str(e)}")
-    finally:
-        st.session_state.is_processing = False
-        st.rerun()
+    def __call__(self, clusters, processed):
+        self.text = f" (showing {len(clusters)} provisional people from {processed} photos, refining)"
+
+def google_drive_job(job, url, download_dir, output_dir, face_app):
+    """Background job: detect faces in a Google Drive folder while it downloads"""
+    stream = GDriveDownloadStream(url, download_dir)
+    preview = PreviewNote()
+    
+    def update_process(fraction):
+        job.update(fraction, f"Downloaded {stream.done}/{stream.total}, processing: {int(fraction * 100)}%{preview.text}")
+    
+    return run_pipeline(download_dir, output_dir, update_progress=update_process, should_cancel=job.is_cancelled,
+                        sources=stream, face_app=face_app, progressive=True, update_preview=preview)
+
+def uploaded_images_job(job, sources, output_dir, face_app):
+    """Background job: run the pipeline over the uploads, decoded in memory"""
+    preview = PreviewNote()
+    
+    def update_process(fraction):
+        job.update(fraction, f"Processing: {int(fraction * 100)}%{preview.text}")
+    
+    return run_pipeline(None, output_dir, update_progress=update_process, should_cancel=job.is_cancelled,
+                        sources=sources, face_app=face_app, progressive=True, update_preview=preview)
+
+def process_google_drive_images(url):
+    """Process images from Google Drive"""
+    start_job(google_drive_job, url, session_dir(DOWNLOAD_DIR), session_dir(OUTPUT_DIR), get_model_pool(),
+              name="google-drive")
 
 def process_uploaded_images(files):
     """Process uploaded image files"""
-    st.session_state.is_processing = True
+    # Wrap the upload buffers without copying; only placed photos are ever written to disk
+    sources = [BufferSource(file.name, file.getbuffer()) for file in files]
+    start_job(uploaded_images_job, sources, session_dir(OUTPUT_DIR), get_model_pool(), name="upload")
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_status():
+    """Poll the background job of this session and show its progress"""
+    job_id = st.session_state.job_id
+    if not job_id:
+        return
     
-    try:
-        # Create directory
-        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-        
-        # Save files
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        for i, file in enumerate(files):
-            file_path = os.path.join(DOWNLOAD_DIR, file.name)
-            with open(file_path, "wb") as f:
-                f.write(file.getbuffer())
-            
-            progress = (i + 1) / len(files)
-            progress_bar.progress(progress * 0.3)  # 30% for file saving
-            status_text.text(f"Saving files: {i + 1}/{len(files)}")
-        
-        # Process faces
-        status_text.text("Detecting and grouping faces...")
-        
-        def update_process(fraction):
-            # Use remaining 70% of progress bar
-            progress_bar.progress(0.3 + (fraction * 0.7))
-            status_text.text(f"Processing: {int((0.3 + fraction * 0.7) * 100)}%")
-        
-        run_pipeline(DOWNLOAD_DIR, OUTPUT_DIR, update_progress=update_process)
-        
-        progress_bar.empty()
-        status_text.empty()
+    job = get_job_manager().get(job_id)
+    if job is None:
+        # Unknown job (e.g. the server restarted)
+        st.session_state.job_id = None
+        st.query_params.pop("job", None)
+        if st.session_state.is_processing:
+            st.session_state.is_processing = False
+            st.rerun()
+        return
+    
+    if job["status"] in (QUEUED, RUNNING):
+        st.progress(job["progress"])
+        st.text(job["message"])
+        if st.button("Cancel", key=f"cancel_{job_id}"):
+            get_job_manager().cancel(job_id)
+        # Progressive runs publish provisional groups; redraw the page when they change
+        version = groups_index_version(results_dir())
+        if version != st.session_state.get("groups_version"):
+            st.session_state.groups_version = version
+            st.rerun()
+        return
+    
+    if job["status"] == DONE:
         st.success("ðŸŽ‰ Processing complete!")
-        
-    except Exception as e:
-        st.error(f"Error processing images: {str(e)}")
-    finally:
+    elif job["status"] == CANCELLED:
+        st.warning("Processing cancelled")
+    else:
+        st.error(f"Error processing images: {job['error']}")
+    
+    # Refresh the whole page once so the new groups and enabled inputs show up
+    if st.session_state.is_processing:
         st.session_state.is_processing = False
         st.rerun()
 
 def display_face_groups():
     """Display detected face groups with enhanced thumbnails"""
-    if not os.path.exists(OUTPUT_DIR):
+    index = get_groups_index()
+    if not index:
         return
     
-    # Get person folders
-    person_folders = [f for f in os.listdir(OUTPUT_DIR) if f.startswith("person_")]
+    # Groups are already sorted by number of images (descending)
+    groups = index["groups"]
     
-    if not person_folders:
+    if not groups:
         return
     
-    # Sort by number of images (descending)
-    person_folders.sort(
-        key=lambda x: len([f for f in os.listdir(os.path.join(OUTPUT_DIR, x)) if f != "thumbnail.jpg"]),
-        reverse=True
-    )
-    
     st.markdown(f"""
     <div class="thumbnail-section">
         <h2 class="section-title">Detected People</h2>
-        <p class="section-subtitle">Found {len(person_folders)} unique individuals. Click on any person to view all their photos.</p>
+        <p class="section-subtitle">Found {len(groups)} unique individuals. Click on any person to view all their photos.</p>
     </div>
     """, unsafe_allow_html=True)
     
     # Create thumbnail grid
+    atlas = get_thumbnail_atlas()
     cols_per_row = 5
-    for i in range(0, len(person_folders), cols_per_row):
+    for i in range(0, len(groups), cols_per_row):
         cols = st.columns(cols_per_row)
         
-        for j, person_folder in enumerate(person_folders[i:i + cols_per_row]):
+        for j, group in enumerate(groups[i:i + cols_per_row]):
             if j < len(cols):
                 with cols[j]:
-                    create_thumbnail_button(person_folder, os.path.join(OUTPUT_DIR, person_folder), i + j)
+                    create_thumbnail_button(group, i + j, atlas)
+
+def show_page_controls(page, page_count):
+    """Previous/next buttons for the person detail pages"""
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("â† Previous", key="detail_prev", disabled=page == 0, use_container_width=True):
+            st.session_state.detail_page = page - 1
+            st.rerun()
+    with col2:
+        st.markdown(f"<p style='text-align: center;'>Page {page + 1} of {page_count}</p>", unsafe_allow_html=True)
+    with col3:
+        if st.button("Next â†’", key="detail_next", disabled=page >= page_count - 1, use_container_width=True):
+            st.session_state.detail_page = page + 1
+            st.rerun()
 
 def show_person_detail():
     """Display detailed view for selected person"""
@@ -593,34 +765,49 @@ def show_person_detail():
         return
     
     person_folder = st.session_state.selected_person
-    person_path = os.path.join(OUTPUT_DIR, person_folder)
+    output_dir = results_dir()
+    person_path = os.path.join(output_dir, person_folder)
+    index = get_groups_index()
+    group = find_group(index, person_folder)
     
-    if not os.path.exists(person_path):
+    if group is None:
         st.error("Person folder not found")
         return
     
-    # Get all images except thumbnail
-    images = [f for f in os.listdir(person_path) if f != "thumbnail.jpg"]
+    # All images except thumbnail, from the results index
+    images = group["files"]
     person_name = person_folder.replace("person_", "Person ")
     
     st.markdown(f"### {person_name}")
     st.markdown(f"**{len(images)}** photos found")
     
-    # Display images in responsive grid
+    # Display the current page of previews in responsive grid
     if images:
+        page_count = (len(images) + DETAIL_PAGE_SIZE - 1) // DETAIL_PAGE_SIZE
+        page = min(st.session_state.detail_page, page_count - 1)
+        page_images = images[page * DETAIL_PAGE_SIZE:(page + 1) * DETAIL_PAGE_SIZE]
+        previews = index.get("previews", {})
+        
         cols_per_row = 4
-        for i in range(0, len(images), cols_per_row):
+        for i in range(0, len(page_images), cols_per_row):
             cols = st.columns(cols_per_row)
             
-            for j, img_name in enumerate(images[i:i + cols_per_row]):
+            for j, img_name in enumerate(page_images[i:i + cols_per_row]):
                 if j < len(cols):
                     with cols[j]:
-                        img_path = os.path.join(person_path, img_name)
+                        preview = previews.get(img_name)
+                        if preview:
+                            img_path = os.path.join(output_dir, preview["path"])
+                        else:
+                            img_path = os.path.join(person_path, img_name)
                         try:
                             image = Image.open(img_path)
                             st.image(image, use_container_width=True)
                         except Exception as e:
                             st.error(f"Error loading image {img_name}: {e}")
+        
+        if page_count > 1:
+            show_page_controls(page, page_count)
     else:
         st.warning("No images found for this person")
 